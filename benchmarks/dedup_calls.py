@@ -0,0 +1,88 @@
+# coding=utf-8
+
+"""
+Benchmark of the near-duplicate prefilter (dedup.prefiltered) on a synthetic corpus.
+
+The corpus consists of edited copies of a number of base texts: each copy has a few words replaced.
+The benchmark counts the API calls made with and without the prefilter (the API is replaced by a local
+transport) and the share of documents which reused the result of a copy of a different base text.
+
+    python benchmarks/dedup_calls.py --baseTexts 30 --documents 200 --editRate 0.01
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geneeasdk.sentiment import getSentiment
+from geneeasdk.util import dedup
+from geneeasdk.util.datautil import Document
+from geneeasdk.util.restutil import TransportResponse
+
+VOCABULARY = ('city council government market police report people year man woman found says new old '
+              'school river bank court minister company price weather team match season village').split()
+
+def synthCorpus(baseTexts, documents, editRate, textWords, seed):
+    """
+    @return: list of tuples (Document, index of its base text)
+    """
+    rnd = random.Random(seed)
+    bases = [[rnd.choice(VOCABULARY) for _ in range(textWords)] for _ in range(baseTexts)]
+    corpus = []
+    for i in range(documents):
+        baseIdx = rnd.randrange(baseTexts)
+        words = [rnd.choice(VOCABULARY) if rnd.random() < editRate else w for w in bases[baseIdx]]
+        corpus.append((Document.make(str(i), ' '.join(words), language='en'), baseIdx))
+    return corpus
+
+class CountingTransport:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, url, headers, data, timeout):
+        self.calls += 1
+        return TransportResponse(200, json.dumps({'sentiment': 0.0, 'label': 'neutral', 'language': 'en'}))
+
+def run(corpus, threshold):
+    """
+    @return: tuple (number of API calls, number of wrong reuses, seconds)
+    """
+    transport = CountingTransport()
+    audits = []
+    apiFunc = getSentiment if threshold is None else dedup.prefiltered(getSentiment, threshold, audit=audits.append)
+    startTime = time.perf_counter()
+    for _ in apiFunc((doc for doc, _ in corpus), {}, url='local', transport=transport):
+        pass
+    elapsed = time.perf_counter() - startTime
+
+    baseOf = {doc.uid: baseIdx for doc, baseIdx in corpus}
+    wrong = sum(baseOf[a.uid] != baseOf[a.representativeUid] for a in audits)
+    return transport.calls, wrong, elapsed
+
+def main(cliargs=None):
+    parser = ArgumentParser(description='Benchmark of the near-duplicate prefilter')
+    parser.add_argument('--baseTexts', type=int, default=30)
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--editRate', type=float, default=0.01, help='probability that a word is replaced')
+    parser.add_argument('--textWords', type=int, default=200)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.95, 0.9, 0.85])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(sys.argv[1:] if cliargs is None else cliargs)
+
+    corpus = synthCorpus(args.baseTexts, args.documents, args.editRate, args.textWords, args.seed)
+    print('threshold\tcalls\treduction\twrongReuses\tseconds')
+    baseCalls, _, elapsed = run(corpus, None)
+    print('none\t{}\t0.0%\t0\t{:.3f}'.format(baseCalls, elapsed))
+    for threshold in args.thresholds:
+        calls, wrong, elapsed = run(corpus, threshold)
+        print('{}\t{}\t{:.1%}\t{}\t{:.3f}'.format(threshold, calls, 1 - calls / baseCalls, wrong, elapsed))
+
+if __name__ == '__main__':
+    main()
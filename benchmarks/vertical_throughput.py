@@ -0,0 +1,80 @@
+# coding=utf-8
+
+"""
+Throughput benchmark of reading a vertical file: the sequential generators (vertical.tabularDocStream
+and vertical.docStream) compared with the parallel chunked readers (vertical.parallelTabularDocStream
+and vertical.parallelDocStream) on a generated file.
+
+    python benchmarks/vertical_throughput.py --documents 50000 --processCounts 1 2 4
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geneeasdk.util import vertical
+
+DOC_ID_REGEX = r'doc\d+'
+
+WORDS = 'the city council market police report people year man woman found says new'.split()
+TAGS = 'DT NN NN NN NN NN NNS NN NN NN VBD VBZ JJ'.split()
+
+def writeVertical(path, documents, sentences, words, seed):
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for docNo in range(documents):
+            f.write('doc{}\n'.format(docNo))
+            for _ in range(sentences):
+                for _ in range(words):
+                    i = rnd.randrange(len(WORDS))
+                    f.write('{}\t{}\t{}\n'.format(WORDS[i], WORDS[i], TAGS[i]))
+                f.write('\n')
+
+def measure(docs):
+    """
+    @return: tuple (number of documents, seconds)
+    """
+    startTime = time.perf_counter()
+    count = sum(1 for _ in docs)
+    return count, time.perf_counter() - startTime
+
+def main(cliargs=None):
+    parser = ArgumentParser(description='Throughput benchmark of the vertical format readers')
+    parser.add_argument('--documents', type=int, default=20000)
+    parser.add_argument('--sentences', type=int, default=10)
+    parser.add_argument('--words', type=int, default=15)
+    parser.add_argument('--processCounts', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--chunkSize', type=int, default=vertical.DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(sys.argv[1:] if cliargs is None else cliargs)
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, 'bench.vert')
+        writeVertical(path, args.documents, args.sentences, args.words, args.seed)
+        sizeMb = os.path.getsize(path) / 2**20
+        print('file: {:.1f} MB, {} documents'.format(sizeMb, args.documents))
+        print('reader\tdocuments\tseconds\tMB/s')
+
+        readers = (
+            ('tabular', vertical.tabularDocStream, vertical.parallelTabularDocStream),
+            ('document', vertical.docStream, vertical.parallelDocStream),
+        )
+        for name, sequentialReader, parallelReader in readers:
+            with open(path, encoding='utf-8') as f:
+                count, elapsed = measure(sequentialReader(f, DOC_ID_REGEX))
+            print('{} sequential\t{}\t{:.3f}\t{:.1f}'.format(name, count, elapsed, sizeMb / elapsed))
+
+            for processCount in args.processCounts:
+                count, elapsed = measure(parallelReader(path, DOC_ID_REGEX,
+                        processCount=processCount, chunkSize=args.chunkSize))
+                print('{} parallel({})\t{}\t{:.3f}\t{:.1f}'.format(
+                        name, processCount, count, elapsed, sizeMb / elapsed))
+
+if __name__ == '__main__':
+    main()
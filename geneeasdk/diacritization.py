@@ -44,17 +44,27 @@ def testResults(inputsAndResults):
         print(apiInput, result)
 
 def evaluateDiac(inputsAndResults, trueVals):
-    raise Exception('diacritization evaluation not implemented yet')
+    """
+    Match the diacritized words against the true text word by word.
+    """
+    from geneeasdk.util import evalutil
 
-def main(cliargs):
+    evaluation = evalutil.MatchEval()
+    for (_, result), trueVal in zip(inputsAndResults, trueVals):
+        evaluation.add(enumerate(trueVal.split()), enumerate(result.text.split()))
+    return evaluation
+
+def main(cliargs=None):
+    cliargs = sys.argv[1:] if cliargs is None else cliargs
     cli = s2cli.createS2Cli(
             defaultUrl=DEFAULT_URL,
             apiWrapFunc=getDiacText,
             runFunc=outputResults,
             testFunc=testResults,
-            evalFunc=evaluateDiac
+            evalFunc=evaluateDiac,
+            resultClass=DiacResponse
     )
     return cli(cliargs)
 
 if __name__ == '__main__':
-    sys.exit(main(sys.argv[1:]))
+    sys.exit(main())
@@ -11,7 +11,8 @@ from geneeasdk import s2cli
 from geneeasdk.util import restutil
 from geneeasdk.util.restutil import S2ApiInput
 
-from collections import namedtuple
+from bisect import bisect_right
+from collections import deque, namedtuple
 
 DEFAULT_URL = 'https://api.geneea.com/s2/entities'
 
@@ -46,6 +47,68 @@ def getEntities(docs, flags, **kwargs):
             **kwargs
     )
 
+def remapOffsets(response, offsetMaps):
+    """
+    Map offsets of entity instances in preprocessed texts back to the original texts.
+    @param response: EntitiesResponse
+    @param offsetMaps: dictionary text segment (text, title or lead) -> preprocess.OffsetMap
+    @return: EntitiesResponse with the original offsets
+    """
+    def remapInstance(instance):
+        offsetMap = offsetMaps.get(instance.textSegment)
+        if offsetMap is None:
+            return instance
+        return instance._replace(textOffset=offsetMap.toOriginal(instance.textOffset))
+
+    entities = [e._replace(instances=[remapInstance(i) for i in e.instances]) for e in response.entities]
+    return response._replace(entities=entities)
+
+def splitEntities(response, pack):
+    """
+    Split the response for a packed document to responses for the individual sentences.
+    Entity instances are assigned to the sentences by their offsets, which are made relative to the sentence.
+    @param response: EntitiesResponse for the document of given pack
+    @param pack: vertical.SentencePack
+    @return: list of EntitiesResponse, one for each sentence of the pack
+    """
+    sentenceEntities = [[] for _ in pack.offsets]
+    for entity in response.entities:
+        sentenceInstances = {}
+        for instance in entity.instances:
+            sentNo = bisect_right(pack.offsets, instance.textOffset) - 1
+            offset = instance.textOffset - pack.offsets[sentNo]
+            sentenceInstances.setdefault(sentNo, []).append(instance._replace(textOffset=offset))
+        for sentNo, instances in sentenceInstances.items():
+            sentenceEntities[sentNo].append(entity._replace(instances=instances))
+    return [EntitiesResponse(entities, response.language) for entities in sentenceEntities]
+
+def getSentenceEntities(packs, flags, **kwargs):
+    """
+    Recognize entities in individual sentences using a single API call for each pack of sentences.
+    @param packs: iterable of vertical.SentencePack, see vertical.packedSentenceDocStream()
+    @param flags: additional API parameters
+    @param kwargs: arguments delegated to getEntities(); the API inputs are not returned even if returnInputs
+        is true, the results are identified by the sentence IDs
+    @return: generator of tuples (sentence ID, EntitiesResponse); if a call fails and failFast is false,
+        the exception is returned for each sentence of the pack
+    """
+    returnInputs = kwargs.get('returnInputs')
+    pending = deque()
+
+    def docs():
+        for pack in packs:
+            pending.append(pack)
+            yield pack.document
+
+    for result in getEntities(docs(), flags, **kwargs):
+        pack = pending.popleft()
+        if returnInputs:
+            result = result[1]
+        if isinstance(result, Exception):
+            yield from ((sentenceId, result) for sentenceId in pack.sentenceIds)
+        else:
+            yield from zip(pack.sentenceIds, splitEntities(result, pack))
+
 def outputResults(callResults):
     for result in callResults:
         print(result, sep='\t')
@@ -54,18 +117,43 @@ def testResults(inputsAndResults):
     for apiInput, result in inputsAndResults:
         print(apiInput, result)
 
-def evaluateEntities(inputsAndResults, trueVals):
-    raise Exception('entities evaluation not implemented yet')
+def _trueSpans(trueVal):
+    spans = []
+    for span in trueVal.split('|'):
+        if span:
+            fields = span.split(':', 2)
+            spans.append((int(fields[0]), int(fields[1])) + tuple(fields[2:]))
+    return spans
 
-def main(cliargs):
+def evaluateEntities(inputsAndResults, trueVals):
+    """
+    Match the entity instances against true values, which are lists of spans separated by '|'.
+    A span is either offset:length or offset:length:type; entity types are compared in documents
+    where any of the true spans has a type.
+    """
+    from geneeasdk.util import evalutil
+
+    evaluation = evalutil.MatchEval()
+    for (_, result), trueVal in zip(inputsAndResults, trueVals):
+        trueSpans = _trueSpans(trueVal)
+        typed = any(len(span) > 2 for span in trueSpans)
+        predictedSpans = [(i.textOffset, len(i.text)) + ((e.type,) if typed else ())
+                          for e in result.entities for i in e.instances]
+        evaluation.add(trueSpans, predictedSpans)
+    return evaluation
+
+def main(cliargs=None):
+    cliargs = sys.argv[1:] if cliargs is None else cliargs
     cli = s2cli.createS2Cli(
             defaultUrl=DEFAULT_URL,
             apiWrapFunc=getEntities,
             runFunc=outputResults,
             testFunc=testResults,
-            evalFunc=evaluateEntities
+            evalFunc=evaluateEntities,
+            remapFunc=remapOffsets,
+            resultClass=EntitiesResponse
     )
     return cli(cliargs)
 
 if __name__ == '__main__':
-    sys.exit(main(sys.argv[1:]))
+    sys.exit(main())
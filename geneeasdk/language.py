@@ -44,17 +44,24 @@ def testResults(inputsAndResults):
         print(apiInput, result)
 
 def evaluateLanguage(inputsAndResults, trueVals):
-    raise Exception('language detection evaluation not implemented yet')
+    from geneeasdk.util import evalutil
 
-def main(cliargs):
+    evaluation = evalutil.ClassificationEval()
+    for (_, result), trueVal in zip(inputsAndResults, trueVals):
+        evaluation.add(trueVal, result.language)
+    return evaluation
+
+def main(cliargs=None):
+    cliargs = sys.argv[1:] if cliargs is None else cliargs
     cli = s2cli.createS2Cli(
             defaultUrl=DEFAULT_URL,
             apiWrapFunc=getLanguage,
             runFunc=outputResults,
             testFunc=testResults,
-            evalFunc=evaluateLanguage
+            evalFunc=evaluateLanguage,
+            resultClass=LanguageResponse
     )
     return cli(cliargs)
 
 if __name__ == '__main__':
-    sys.exit(main(sys.argv[1:]))
+    sys.exit(main())
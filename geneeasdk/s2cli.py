@@ -8,9 +8,12 @@ import itertools
 import sys
 import time
 
-from geneeasdk.util import cliutil, datautil
+from geneeasdk.util import cliutil, datautil, restutil, trace
 
 from argparse import ArgumentParser
+from collections import deque
+from contextlib import ExitStack
+from operator import itemgetter
 
 def getS2Flags(args):
     """
@@ -32,10 +35,193 @@ def getS2Argparser(defaultUrl):
     parser = cliutil.addLangArg(parser)
     parser = cliutil.addThreadCountArg(parser, default=1)
     parser = cliutil.addOptionsArg(parser)
+    parser = cliutil.addCallRateArg(parser, help='client-side limit of API calls per second')
+    parser = cliutil.addCharRateArg(parser, help='client-side limit of sent characters per day')
+    parser = cliutil.addRateStateFileArg(parser, help='file sharing the rate limits among local processes')
+    parser = cliutil.addDedupThresholdArg(parser,
+            help='call the API only once for documents with near-duplicate texts of at least this similarity')
+    parser = cliutil.addDedupAuditArg(parser, help='TSV file recording which document reused which result')
+    parser = cliutil.addDeltaStoreArg(parser,
+            help='file storing results of previous runs, the API is called only for new or changed documents')
+    parser = cliutil.addDeltaPruneArg(parser, help='remove documents missing in the input from the delta store')
+    parser = cliutil.addMaxInFlightBytesArg(parser, help='maximal size of documents being processed at a time')
+    parser = cliutil.addMaxRssArg(parser, help='memory (RSS) in MB above which no new documents are read')
+    parser = cliutil.addReportIntervalArg(parser, help='seconds between progress reports printed to stderr')
+    parser = cliutil.addEvalStateArg(parser, help='file to save the evaluation to, e.g. for merging sharded runs')
+    parser = cliutil.addEvalMergeArg(parser, help='saved evaluations merged into the evaluation of this run')
+    parser = cliutil.addBootstrapArg(parser, default=0,
+            help='number of bootstrap samples for evaluation confidence intervals')
+    parser = cliutil.addPreprocessArg(parser, choices=['html', 'whitespace', 'dropEmpty'], default=[],
+            help='preprocessing of the texts before sending them to the API')
+    parser = cliutil.addMaxCharsArg(parser, help='truncate the texts to this number of characters')
+    parser = cliutil.addRecordArg(parser, help='log file recording all API calls and responses')
+    parser = cliutil.addReplayArg(parser, help='log file to replay API responses from instead of calling the API')
+    parser = cliutil.addReplaySpeedArg(parser, default=1.0,
+            help='speed of the replay relative to the recorded latencies, 0 for no delays')
+    parser = cliutil.addTraceArg(parser, help='file to write a trace of the processing to (Chrome trace format)')
+    parser = cliutil.addProfileArg(parser, help='file to write cProfile statistics of the run to')
 
     return parser
 
-def createS2Cli(*, defaultUrl, apiWrapFunc, runFunc, testFunc, evalFunc):
+def getRateLimiter(args):
+    """
+    @param args: arguments returned from argument parser
+    @return: RateLimiter corresponding to the args or None if no limit is set
+    """
+    if not (args.callsPerSecond or args.charsPerDay):
+        return None
+    return restutil.RateLimiter(
+            callLimit=restutil.RateLimit(args.callsPerSecond, 1) if args.callsPerSecond else None,
+            charLimit=restutil.RateLimit(args.charsPerDay, 24 * 60 * 60) if args.charsPerDay else None,
+            stateFile=args.rateStateFile
+    )
+
+def getMonitor(args):
+    """
+    @param args: arguments returned from argument parser
+    @return: PipelineMonitor corresponding to the args or None if neither reports nor a memory limit are requested
+    """
+    if args.reportInterval is None and args.maxRss is None:
+        return None
+    from geneeasdk.util import monitor
+
+    maxRss = args.maxRss * 2**20 if args.maxRss is not None else None
+    return monitor.PipelineMonitor(reportInterval=args.reportInterval, maxRss=maxRss)
+
+def getTransport(args, resources):
+    """
+    @param args: arguments returned from argument parser
+    @param resources: ExitStack closing the transport
+    @return: transport of the API calls corresponding to the args or None for the default one
+    """
+    if not (args.record or args.replay):
+        return None
+    from geneeasdk.util import replay
+
+    transport = None
+    if args.replay:
+        transport = replay.ReplayTransport(args.replay, speed=args.replaySpeed or None)
+    if args.record:
+        transport = resources.enter_context(replay.RecordingTransport(args.record, transport=transport))
+    return transport
+
+def getCallArgs(args, resources):
+    """
+    @param args: arguments returned from argument parser
+    @param resources: ExitStack closing resources (e.g. files) used by the API calls
+    @return: keyword arguments of the API wrapping function extracted from args
+    """
+    return {
+        'url': args.url,
+        'key': args.userKey,
+        'threadCount': args.threadCount,
+        'rateLimiter': getRateLimiter(args),
+        'maxInFlightBytes': args.maxInFlightBytes,
+        'monitor': getMonitor(args),
+        'transport': getTransport(args, resources),
+    }
+
+def getApiFunc(apiWrapFunc, args, resources, remapFunc=None, resultClass=None):
+    """
+    @param apiWrapFunc: function wrapping the API call itself
+    @param args: arguments returned from argument parser
+    @param resources: ExitStack closing resources (e.g. files) used by the returned function
+    @param remapFunc: function mapping offsets in API results to the texts before preprocessing, or None
+    @param resultClass: class of the API call results with the fromDict() method, required by the delta store
+    @return: apiWrapFunc possibly wrapped by the processing stages requested by args
+    """
+    apiFunc = apiWrapFunc
+    if args.dedupThreshold:
+        from geneeasdk.util import dedup
+
+        audit = None
+        if args.dedupAudit:
+            auditFile = resources.enter_context(open(args.dedupAudit, 'w', encoding='utf-8'))
+            audit = lambda record: print(datautil.tsvLine(record), file=auditFile)
+        apiFunc = dedup.prefiltered(apiFunc, threshold=args.dedupThreshold, audit=audit)
+    if args.deltaStore:
+        from geneeasdk.util import delta
+
+        if resultClass is None:
+            raise ValueError('the delta store is not supported by this API')
+        store = resources.enter_context(delta.FingerprintStore(args.deltaStore))
+        apiFunc = delta.incremental(apiFunc, store, resultClass, prune=args.deltaPrune)
+    if args.preprocess or args.maxChars:
+        from geneeasdk.util import preprocess
+
+        preprocessor = preprocess.Preprocessor(stripHtml='html' in args.preprocess,
+                collapseWhitespace='whitespace' in args.preprocess, maxChars=args.maxChars,
+                dropEmpty='dropEmpty' in args.preprocess)
+        # the outermost stage, so that the dropped documents do not reach the other stages
+        apiFunc = preprocess.preprocessed(apiFunc, preprocessor, remapFunc=remapFunc)
+        resources.callback(lambda: print('Preprocessing:', preprocessor.stats, file=sys.stderr))
+    return apiFunc
+
+def _printedErrors(results):
+    """
+    Print an error line instead of each failed result (e.g. preprocess.EmptyDocument), so that the output
+    of runFunc stays aligned with the input rows.
+    @return: generator of the successful results
+    """
+    for result in results:
+        if isinstance(result, Exception):
+            print(restutil.errorMsg(result))
+        else:
+            yield result
+
+def _withoutDropped(inputsAndResults, trueVals):
+    """
+    Skip documents dropped by preprocessing together with their true values.
+    @return: tuple (iterable of (input, result), iterable of true values)
+    """
+    from geneeasdk.util import preprocess
+
+    pairs = ((inputAndResult, trueVal) for inputAndResult, trueVal in zip(inputsAndResults, trueVals)
+             if not isinstance(inputAndResult[1], preprocess.EmptyDocument))
+    # consumed in lockstep by the evaluation, so the tee buffers at most one pair
+    resultPairs, truePairs = itertools.tee(pairs, 2)
+    return map(itemgetter(0), resultPairs), map(itemgetter(1), truePairs)
+
+def _withTraceIds(docs):
+    """
+    Record the uids of the documents as they are read, so that the output spans can be tagged with them;
+    the API functions return the results in the input order.
+    @return: tuple (document iterable, iterable of the uids of the results), or (docs, None) if tracing is disabled
+    """
+    if not trace.getTracer().enabled:
+        return docs, None
+    uids = deque()
+
+    def recorded():
+        for doc in docs:
+            uids.append(doc.uid)
+            yield doc
+
+    return recorded(), (uids.popleft() for _ in itertools.count())
+
+def diagnosed(action):
+    """
+    @param action: CLI action, function args -> return value
+    @return: the action tracing and profiling its run if requested by the --trace and --profile arguments
+    """
+    def wrapped(args):
+        with ExitStack() as diagnostics:
+            if args.trace:
+                tracer = diagnostics.enter_context(trace.Tracer(args.trace))
+                diagnostics.enter_context(trace.activate(tracer))
+            if args.profile:
+                import cProfile
+
+                profiler = cProfile.Profile()
+                # callbacks run in the reverse order: disable, then save
+                diagnostics.callback(profiler.dump_stats, args.profile)
+                diagnostics.callback(profiler.disable)
+                profiler.enable()
+            return action(args)
+
+    return wrapped
+
+def createS2Cli(*, defaultUrl, apiWrapFunc, runFunc, testFunc, evalFunc, remapFunc=None, resultClass=None):
     """
     Create a CLI - callable object (cmd arguments) -> return value
     which wraps an S2 API function and allows 3 actions:
@@ -50,28 +236,39 @@ def createS2Cli(*, defaultUrl, apiWrapFunc, runFunc, testFunc, evalFunc):
         It should accept an iterable of tuples (API input, API call result)
     @param evalFunc: function implementing the 'eval' action. 
         It should accept an iterable of tuples (API input, API call result) and an iterable of expected 'true' values
+        and return an evalutil.Evaluation (or None if it reports the results by itself)
+    @param remapFunc: function (API call result, dictionary text segment -> preprocess.OffsetMap) -> result
+        with offsets in the original texts; used if the texts are preprocessed
+    @param resultClass: class of the API call results with the fromDict() method, used to restore the results
+        from the delta store
     @return: callable object (cmd arguments) -> return value
     """
     parser = getS2Argparser(defaultUrl)
 
     def run(args):
-        docs = datautil.docStream(sys.stdin, cliutil.columnConfig(args))
+        docs, traceIds = _withTraceIds(datautil.docStream(sys.stdin, cliutil.columnConfig(args)))
         flags = getS2Flags(args)
 
-        results = apiWrapFunc(docs, flags, url=args.url, key=args.userKey, threadCount=args.threadCount)
-        runFunc(results)
+        with ExitStack() as resources:
+            apiFunc = getApiFunc(apiWrapFunc, args, resources, remapFunc, resultClass)
+            results = apiFunc(docs, flags, **getCallArgs(args, resources))
+            runFunc(_printedErrors(trace.getTracer().consumed(results, 'output', traceIds)))
         return 0
 
     def test(args):
-        docs = datautil.docStream(sys.stdin, cliutil.columnConfig(args))
+        docs, traceIds = _withTraceIds(datautil.docStream(sys.stdin, cliutil.columnConfig(args)))
         flags = getS2Flags(args)
 
-        startTime = time.time()
-        inputsAndResults = apiWrapFunc(docs, flags, url=args.url, key=args.userKey,
-                threadCount=args.threadCount, returnInputs=True, failFast=False)
-        testFunc(inputsAndResults)
-        timeElapsed = time.time() - startTime
+        with ExitStack() as resources:
+            callArgs = getCallArgs(args, resources)
+            apiFunc = getApiFunc(apiWrapFunc, args, resources, remapFunc, resultClass)
+            startTime = time.time()
+            inputsAndResults = apiFunc(docs, flags, returnInputs=True, failFast=False, **callArgs)
+            testFunc(trace.getTracer().consumed(inputsAndResults, 'output', traceIds))
+            timeElapsed = time.time() - startTime
         print("Processing time: ", timeElapsed, "seconds")
+        if callArgs['rateLimiter']:
+            print("Rate limit wait time: ", callArgs['rateLimiter'].stats.waitTime, "seconds")
         return 0
 
     def evaluate(args):
@@ -82,14 +279,24 @@ def createS2Cli(*, defaultUrl, apiWrapFunc, runFunc, testFunc, evalFunc):
 
         trueVals = datautil.colStream(evalLines, columnConfig['eval'])
 
-        results = apiWrapFunc(docs, flags, url=args.url, key=args.userKey,
-                threadCount=args.threadCount, returnInputs=True)
-        evalFunc(results, trueVals)
+        with ExitStack() as resources:
+            apiFunc = getApiFunc(apiWrapFunc, args, resources, remapFunc, resultClass)
+            results = apiFunc(docs, flags, returnInputs=True, **getCallArgs(args, resources))
+            evaluation = evalFunc(*_withoutDropped(results, trueVals))
+
+        if evaluation is not None:
+            from geneeasdk.util import evalutil
+
+            for path in args.evalMerge or ():
+                evaluation.merge(evalutil.load(path))
+            if args.evalState:
+                evaluation.save(args.evalState)
+            print(evaluation.report(bootstrapSamples=args.bootstrap))
         return 0
 
     cli = cliutil.simpleCli(parser, {
-        'run': run,
-        'test': test,
-        'eval': evaluate
+        'run': diagnosed(run),
+        'test': diagnosed(test),
+        'eval': diagnosed(evaluate)
     })
     return cli
@@ -44,17 +44,24 @@ def testResults(inputsAndResults):
         print(apiInput, result)
 
 def evaluateSentiment(inputsAndResults, trueVals):
-    raise Exception('sentiment evaluation not implemented yet')
+    from geneeasdk.util import evalutil
 
-def main(cliargs):
+    evaluation = evalutil.RegressionEval()
+    for (_, result), trueVal in zip(inputsAndResults, trueVals):
+        evaluation.add(float(trueVal), result.sentiment)
+    return evaluation
+
+def main(cliargs=None):
+    cliargs = sys.argv[1:] if cliargs is None else cliargs
     cli = s2cli.createS2Cli(
             defaultUrl=DEFAULT_URL,
             apiWrapFunc=getSentiment,
             runFunc=outputResults,
             testFunc=testResults,
-            evalFunc=evaluateSentiment
+            evalFunc=evaluateSentiment,
+            resultClass=SentimentResponse
     )
     return cli(cliargs)
 
 if __name__ == '__main__':
-    sys.exit(main(sys.argv[1:]))
+    sys.exit(main())
@@ -46,17 +46,28 @@ def testResults(inputsAndResults):
         print(apiInput, result)
 
 def evaluateTopic(inputsAndResults, trueVals):
-    raise Exception('tagging evaluation not implemented yet')
+    """
+    Match the tags against true values, which are lists of tags separated by '|'. Tags are compared case-insensitively.
+    """
+    from geneeasdk.util import evalutil
 
-def main(cliargs):
+    evaluation = evalutil.MatchEval()
+    for (_, result), trueVal in zip(inputsAndResults, trueVals):
+        trueTags = {tag.strip().lower() for tag in trueVal.split('|') if tag.strip()}
+        evaluation.add(trueTags, {tag.text.lower() for tag in result.tags})
+    return evaluation
+
+def main(cliargs=None):
+    cliargs = sys.argv[1:] if cliargs is None else cliargs
     cli = s2cli.createS2Cli(
             defaultUrl=DEFAULT_URL,
             apiWrapFunc=getTags,
             runFunc=outputResults,
             testFunc=testResults,
-            evalFunc=evaluateTopic
+            evalFunc=evaluateTopic,
+            resultClass=TagsResponse
     )
     return cli(cliargs)
 
 if __name__ == '__main__':
-    sys.exit(main(sys.argv[1:]))
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# coding=utf-8
+
+"""
+Long-lived client for calling REST APIs from online services
+"""
+
+import json
+import threading
+
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Queue
+
+from geneeasdk.util import restutil, trace
+
+DEFAULT_MAX_BATCH_SIZE = 64
+
+_Request = namedtuple('_Request', ['payload', 'callArgs', 'future', 'traceId'])
+
+def _identity(x):
+    return x
+
+def _groupKey(request):
+    """
+    @return: key of requests which can be answered by a single remote call
+    """
+    key = (request.payload, tuple(sorted(request.callArgs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        # unhashable call arguments, the request cannot share its call
+        return id(request)
+    return key
+
+class ResidentClient:
+    """
+    A resident client owning a pool of worker threads and warm HTTP connections (one requests.Session
+    per worker thread). It is meant to be created once and shared by all requests of a service.
+
+    A request is handed to the workers as soon as one of them is free, so the client adds no delay.
+    While all the workers are busy, the requests of concurrent callers wait in a queue; once a worker is free,
+    the dispatcher takes all the waiting requests (up to maxBatchSize) as a micro-batch. Identical requests
+    within a batch (same serialized input and call arguments) are sent only once and share the result.
+
+    The client should be closed by close() or used as a context manager.
+    """
+
+    def __init__(self, threadCount=4, maxBatchSize=DEFAULT_MAX_BATCH_SIZE, maxPending=0):
+        """
+        @param threadCount: number of worker threads, i.e. the maximal number of concurrent remote calls
+        @param maxBatchSize: maximal number of requests in a batch
+        @param maxPending: maximal number of requests waiting for dispatch, submit() blocks when exceeded;
+            zero means no limit
+        """
+        self.threadCount = threadCount
+        self.maxBatchSize = maxBatchSize
+
+        self._queue = Queue(maxsize=maxPending)
+        self._executor = ThreadPoolExecutor(max_workers=threadCount)
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+        # guards _closed, requests are queued while holding it, so that none is queued after the stop sentinel
+        self._submitLock = threading.Lock()
+        self._closed = False
+        # number of calls handed to the workers and not yet finished
+        self._busy = 0
+        self._workerFree = threading.Condition()
+
+        self._dispatcher = threading.Thread(target=self._dispatchLoop, name='ResidentClient-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def submit(self, inputData, **callArgs) -> Future:
+        """
+        Schedule a remote call. The input is serialized in the calling thread.
+        If tracing is enabled, the call is traced with the trace ID bound to the input (see trace.Tracer.bind())
+        or with the trace ID of the caller's context.
+        @param inputData: input data object
+        @param callArgs: arguments delegated to restutil.remoteCall(), except session (the client uses its own)
+        @return: future of the deserialized API response or of the Exception in case of any error
+        """
+        if 'session' in callArgs:
+            raise ValueError('the client uses its own sessions, session cannot be given')
+        serialize = callArgs.pop('serialize', json.dumps)
+        tracer = trace.getTracer()
+        traceId = (tracer.traceIdOf(inputData) or tracer.currentTraceId()) if tracer.enabled else None
+        request = _Request(serialize(inputData), callArgs, Future(), traceId)
+        with self._submitLock:
+            if self._closed:
+                raise RuntimeError('cannot submit to a closed client')
+            # may block if maxPending is reached, the dispatcher keeps emptying the queue without this lock
+            self._queue.put(request)
+        return request.future
+
+    def map(self, inputData, window=None, **callArgs):
+        """
+        Lazy map remote calls on given inputs.
+        @param inputData: iterable of input data objects
+        @param window: maximal number of submitted calls whose results were not yet returned,
+            2 * threadCount by default
+        @param callArgs: arguments delegated to restutil.remoteCall()
+        @return: generator of tuples (input, output) in the input order
+        """
+        window = 2 * self.threadCount if window is None else window
+        buffer = deque()
+        try:
+            for inputObj in inputData:
+                buffer.append((inputObj, self.submit(inputObj, **callArgs)))
+                if len(buffer) >= window:
+                    inputObj, future = buffer.popleft()
+                    yield inputObj, future.result()
+            while buffer:
+                inputObj, future = buffer.popleft()
+                yield inputObj, future.result()
+        finally:
+            for _, future in buffer:
+                future.cancel()
+
+    def close(self):
+        """
+        Finish all submitted calls and release the worker threads and connections.
+        """
+        with self._submitLock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        for session in self._sessions:
+            session.close()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+            session = self._local.session = requests.Session()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def _dispatchLoop(self):
+        stop = False
+        while not stop:
+            request = self._queue.get()
+            if request is None:
+                break
+            # the request could not start earlier anyway, meanwhile other requests gather in the queue
+            with self._workerFree:
+                while self._busy >= self.threadCount:
+                    self._workerFree.wait()
+            batch = [request]
+            while len(batch) < self.maxBatchSize:
+                try:
+                    request = self._queue.get_nowait()
+                except Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        groups = OrderedDict()
+        for request in batch:
+            groups.setdefault(_groupKey(request), []).append(request)
+        with self._workerFree:
+            self._busy += len(groups)
+        for requests in groups.values():
+            self._executor.submit(self._call, requests)
+
+    def _call(self, requests):
+        try:
+            self._callGroup(requests)
+        finally:
+            with self._workerFree:
+                self._busy -= 1
+                self._workerFree.notify()
+
+    def _callGroup(self, requests):
+        futures = [r.future for r in requests if r.future.set_running_or_notify_cancel()]
+        if not futures:
+            return
+        first = requests[0]
+        try:
+            session = self._session() if first.callArgs.get('transport') is None else None
+            # identical requests share the call and its spans, which are traced as the first one
+            with trace.getTracer().context(first.traceId):
+                result = restutil.remoteCall(inputData=first.payload, serialize=_identity, session=session,
+                        **first.callArgs)
+        except Exception as e:
+            # e.g. invalid call arguments; the executor would swallow the exception and the callers would wait forever
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(result)
@@ -3,7 +3,6 @@
 """
 Functions related to building and using CLIs. Contains functions for adding commonly used arguments.
 """
-import yaml
 
 def simpleCli(argparser, actions):
     """
@@ -61,8 +60,90 @@ def addThreadCountArg(parser, **kwargs):
     parser.add_argument('-t', '--threads', dest='threadCount', type=int, **kwargs)
     return parser
 
+def addCallRateArg(parser, **kwargs):
+    parser.add_argument('--callsPerSecond', dest='callsPerSecond', type=float, **kwargs)
+    return parser
+
+def addCharRateArg(parser, **kwargs):
+    parser.add_argument('--charsPerDay', dest='charsPerDay', type=int, **kwargs)
+    return parser
+
+def addRateStateFileArg(parser, **kwargs):
+    parser.add_argument('--rateStateFile', dest='rateStateFile', **kwargs)
+    return parser
+
+def addDedupThresholdArg(parser, **kwargs):
+    parser.add_argument('--dedupThreshold', dest='dedupThreshold', type=float, **kwargs)
+    return parser
+
+def addDedupAuditArg(parser, **kwargs):
+    parser.add_argument('--dedupAudit', dest='dedupAudit', **kwargs)
+    return parser
+
+def addDeltaStoreArg(parser, **kwargs):
+    parser.add_argument('--deltaStore', dest='deltaStore', **kwargs)
+    return parser
+
+def addDeltaPruneArg(parser, **kwargs):
+    parser.add_argument('--deltaPrune', dest='deltaPrune', action='store_true', **kwargs)
+    return parser
+
+def addMaxInFlightBytesArg(parser, **kwargs):
+    parser.add_argument('--maxInFlightBytes', dest='maxInFlightBytes', type=int, **kwargs)
+    return parser
+
+def addMaxRssArg(parser, **kwargs):
+    parser.add_argument('--maxRss', dest='maxRss', type=int, **kwargs)
+    return parser
+
+def addReportIntervalArg(parser, **kwargs):
+    parser.add_argument('--reportInterval', dest='reportInterval', type=float, **kwargs)
+    return parser
+
+def addEvalStateArg(parser, **kwargs):
+    parser.add_argument('--evalState', dest='evalState', **kwargs)
+    return parser
+
+def addEvalMergeArg(parser, **kwargs):
+    parser.add_argument('--evalMerge', dest='evalMerge', nargs='+', **kwargs)
+    return parser
+
+def addBootstrapArg(parser, **kwargs):
+    parser.add_argument('--bootstrap', dest='bootstrap', type=int, **kwargs)
+    return parser
+
+def addPreprocessArg(parser, **kwargs):
+    parser.add_argument('--preprocess', dest='preprocess', nargs='+', **kwargs)
+    return parser
+
+def addMaxCharsArg(parser, **kwargs):
+    parser.add_argument('--maxChars', dest='maxChars', type=int, **kwargs)
+    return parser
+
+def addRecordArg(parser, **kwargs):
+    parser.add_argument('--record', dest='record', **kwargs)
+    return parser
+
+def addReplayArg(parser, **kwargs):
+    parser.add_argument('--replay', dest='replay', **kwargs)
+    return parser
+
+def addReplaySpeedArg(parser, **kwargs):
+    parser.add_argument('--replaySpeed', dest='replaySpeed', type=float, **kwargs)
+    return parser
+
+def addTraceArg(parser, **kwargs):
+    parser.add_argument('--trace', dest='trace', **kwargs)
+    return parser
+
+def addProfileArg(parser, **kwargs):
+    parser.add_argument('--profile', dest='profile', **kwargs)
+    return parser
+
 def columnConfig(args):
     if args.dataConfig:
+        # imported lazily, YAML configs are optional and the import is relatively expensive
+        import yaml
         with open(args.dataConfig, encoding='utf-8') as configFile:
             config = yaml.load(configFile)
     else:
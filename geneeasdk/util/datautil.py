@@ -11,6 +11,8 @@ from collections import namedtuple
 from collections.abc import Iterable
 from operator import itemgetter
 
+from geneeasdk.util import trace
+
 class Document(namedtuple('Document', ['uid', 'text', 'title', 'lead', 'language', 'domain', 'metadata'])):
     """
     A textual document, typically used as analysis input
@@ -88,8 +90,24 @@ def docStream(lines, config):
     @param config: input data column configuration
     @return: generator of Document objects
     """
+    tracer = trace.getTracer()
+    if tracer.enabled:
+        return _tracedDocStream(lines, config, tracer)
     return map(rowToDocument, tsvRowStream(lines), itertools.repeat(config))
 
+def _tracedDocStream(lines, config, tracer):
+    rows = tsvRowStream(lines)
+    for index in itertools.count():
+        # the span includes reading of the line
+        start = tracer.now()
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        doc = rowToDocument(row, config)
+        tracer.add('parse', start, traceId=doc.uid, index=index)
+        yield doc
+
 def colStream(lines, colNo):
     """
     Create a stream of values of given column from TSV line iterable
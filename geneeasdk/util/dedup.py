@@ -0,0 +1,203 @@
+# coding=utf-8
+
+"""
+Near-duplicate detection of documents, used to avoid API calls for near-identical texts
+"""
+
+import hashlib
+import itertools
+
+from collections import Counter, OrderedDict, deque, namedtuple
+
+from geneeasdk.util import restutil
+from geneeasdk.util.restutil import S2ApiInput
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_SIZE = 100000
+
+NearDuplicate = namedtuple('NearDuplicate', ['uid', 'representativeUid', 'similarity'])
+"""
+Audit record: the document `uid` reused the API result of the document `representativeUid`.
+"""
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    @param text: plain text
+    @param size: number of words in a shingle
+    @return: iterable of shingles (tuples of consecutive lower-cased words) of the text
+    """
+    words = text.lower().split()
+    if len(words) <= size:
+        return [tuple(words)] if words else []
+    return zip(*(itertools.islice(words, i, None) for i in range(size)))
+
+def simhash(text) -> int:
+    """
+    @param text: plain text
+    @return: 64-bit SimHash fingerprint of the text's word shingles
+    """
+    digests = [hashlib.blake2b(' '.join(s).encode('utf-8'), digest_size=8).digest() for s in shingles(text)]
+    if not digests:
+        return 0
+
+    # counting byte values per position is much faster than counting each of the 64 bits per shingle
+    fingerprint = 0
+    for pos in range(FINGERPRINT_BITS // 8):
+        byteCounts = Counter(d[pos] for d in digests)
+        for bit in range(8):
+            bitCount = sum(c for value, c in byteCounts.items() if value >> bit & 1)
+            if 2 * bitCount > len(digests):
+                fingerprint |= 1 << (8 * pos + bit)
+    return fingerprint
+
+def similarity(fingerprint1, fingerprint2) -> float:
+    """
+    @return: similarity of two SimHash fingerprints, i.e. the ratio of the same bits
+    """
+    return 1 - bin(fingerprint1 ^ fingerprint2).count('1') / FINGERPRINT_BITS
+
+class NearDuplicateIndex:
+    """
+    Index of SimHash fingerprints allowing lookup of fingerprints with at least given similarity.
+
+    Fingerprints are split into (maxDistance + 1) bands, so two fingerprints differing in at most
+    maxDistance bits share at least one band. Only fingerprints sharing a band are compared.
+    Thresholds lower than approximately 0.8 make the bands narrow and the lookup slow.
+
+    The index keeps at most maxSize fingerprints; the least recently matched ones are evicted.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, maxSize=DEFAULT_MAX_SIZE, onEvict=None):
+        """
+        @param threshold: minimal similarity of near-duplicates, from (0, 1]
+        @param maxSize: maximal number of fingerprints in the index
+        @param onEvict: function key -> None called when a fingerprint is evicted
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError('threshold has to be in (0, 1], got {}'.format(threshold))
+        self.threshold = threshold
+        self.maxSize = maxSize
+        self._onEvict = onEvict
+
+        bandCount = min(int((1 - threshold) * FINGERPRINT_BITS) + 1, FINGERPRINT_BITS)
+        bounds = [round(i * FINGERPRINT_BITS / bandCount) for i in range(bandCount + 1)]
+        self._bandMasks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+
+        self._fingerprints = OrderedDict()
+        self._bands = {}
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def _bandKeys(self, fingerprint):
+        return [(i, fingerprint >> start & mask) for i, (start, mask) in enumerate(self._bandMasks)]
+
+    def find(self, fingerprint):
+        """
+        @param fingerprint: SimHash fingerprint
+        @return: tuple (key, similarity) of the most similar indexed fingerprint with at least
+            the threshold similarity, or None if there is no such fingerprint
+        """
+        best = None
+        for bandKey in self._bandKeys(fingerprint):
+            for key in self._bands.get(bandKey, ()):
+                sim = similarity(fingerprint, self._fingerprints[key])
+                if sim >= self.threshold and (best is None or sim > best[1]):
+                    best = (key, sim)
+        if best is not None:
+            self._fingerprints.move_to_end(best[0])
+        return best
+
+    def add(self, key, fingerprint):
+        """
+        Add a fingerprint with given key to the index, possibly evicting the least recently used one.
+        """
+        self._fingerprints[key] = fingerprint
+        for bandKey in self._bandKeys(fingerprint):
+            self._bands.setdefault(bandKey, set()).add(key)
+
+        while len(self._fingerprints) > self.maxSize:
+            oldKey, oldFingerprint = self._fingerprints.popitem(last=False)
+            for bandKey in self._bandKeys(oldFingerprint):
+                keys = self._bands[bandKey]
+                keys.discard(oldKey)
+                if not keys:
+                    del self._bands[bandKey]
+            if self._onEvict:
+                self._onEvict(oldKey)
+
+def prefiltered(apiWrapFunc, threshold=DEFAULT_THRESHOLD, maxSize=DEFAULT_MAX_SIZE, audit=None):
+    """
+    Wrap an API function so that it is called only for one representative of each group of documents
+    with near-duplicate texts. The other documents get a copy of the representative's result.
+    Only documents with the same language and domain are considered duplicates. The wrapped function
+    has to return the results in the input order.
+
+    @param apiWrapFunc: function (document iterable, flags, **kwargs) -> iterable of API call results,
+        e.g. entities.getEntities
+    @param threshold: minimal similarity of near-duplicate texts, see NearDuplicateIndex
+    @param maxSize: maximal number of remembered representatives
+    @param audit: function NearDuplicate -> None called for each document reusing a result, or None
+    @return: function with the same signature as apiWrapFunc
+    """
+    def wrapped(docs, flags, **kwargs):
+        results = {}
+        # references of representatives: 1 for being indexed plus 1 for each document waiting for the result
+        refCounts = {}
+        calledReps = deque()
+        indexes = {}
+        seq = itertools.count()
+
+        def release(repSeq):
+            refCounts[repSeq] -= 1
+            if not refCounts[repSeq]:
+                del refCounts[repSeq]
+                results.pop(repSeq, None)
+
+        def evict(key):
+            release(key[0])
+
+        def lookup(doc):
+            fingerprint = simhash(doc.text) if doc.text else None
+            if fingerprint is None:
+                calledReps.append(None)
+                return None
+
+            indexKey = (doc.language or flags.get('language'), doc.domain or flags.get('domain'))
+            index = indexes.get(indexKey)
+            if index is None:
+                index = indexes[indexKey] = NearDuplicateIndex(threshold, maxSize, onEvict=evict)
+            match = index.find(fingerprint)
+            if match is None:
+                repSeq = next(seq)
+                refCounts[repSeq] = 1
+                index.add((repSeq, doc.uid), fingerprint)
+                calledReps.append(repSeq)
+                return None
+
+            (repSeq, repUid), sim = match
+            refCounts[repSeq] += 1
+            if audit:
+                audit(NearDuplicate(doc.uid, repUid, sim))
+
+            def reusedResult():
+                result = results[repSeq]
+                release(repSeq)
+                if kwargs.get('returnInputs'):
+                    return S2ApiInput.fromDocAndFlags(doc, flags), result[1]
+                return result
+            return reusedResult
+
+        def callFunc(repDocs):
+            for result in apiWrapFunc(repDocs, flags, **kwargs):
+                repSeq = calledReps.popleft()
+                if repSeq in refCounts:
+                    results[repSeq] = result
+                yield result
+
+        return restutil.mergedCalls(docs, lookup, callFunc)
+
+    return wrapped
@@ -0,0 +1,171 @@
+# coding=utf-8
+
+"""
+Incremental processing: API calls only for new or changed documents
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+
+from collections import deque
+
+from geneeasdk.util import restutil
+from geneeasdk.util.restutil import S2ApiInput
+
+COMMIT_INTERVAL = 1000
+
+logger = logging.getLogger(__name__)
+
+def toPlain(value):
+    """
+    @param value: API result, e.g. SentimentResponse
+    @return: the value with all namedtuples converted to dictionaries, i.e. the dictionary accepted
+        by the fromDict() method of the result class
+    """
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        return {name: toPlain(v) for name, v in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [toPlain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: toPlain(v) for k, v in value.items()}
+    return value
+
+def fingerprint(apiInput, url) -> bytes:
+    """
+    @param apiInput: S2ApiInput
+    @param url: URL of the API function
+    @return: fingerprint of the input and the API function
+    """
+    data = json.dumps([url, apiInput._asdict()], sort_keys=True)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).digest()
+
+class FingerprintStore:
+    """
+    Persistent store (an SQLite database) of document fingerprints and API results of the last run,
+    keyed by document ID. The results are stored as JSON together with their kind (the name of the result class).
+
+    Each opening of the store starts a new run. Documents which were not stored or touched during the run
+    can be removed by prune().
+    """
+
+    def __init__(self, path):
+        """
+        @param path: path of the database file, created if it does not exist
+        """
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'uid TEXT PRIMARY KEY, fingerprint BLOB NOT NULL, kind TEXT NOT NULL, result TEXT NOT NULL, '
+                'run INTEGER NOT NULL)')
+        lastRun, = self._conn.execute('SELECT MAX(run) FROM results').fetchone()
+        self.run = (lastRun or 0) + 1
+        self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def get(self, uid):
+        """
+        @return: tuple (fingerprint, kind, result as a JSON-decoded object) stored for given document ID or None
+        """
+        row = self._conn.execute('SELECT fingerprint, kind, result FROM results WHERE uid = ?', (uid,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def put(self, uid, fingerprint, kind, result):
+        """
+        @param result: JSON-serializable result, see toPlain()
+        """
+        self._conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                (uid, fingerprint, kind, json.dumps(result, ensure_ascii=False), self.run))
+        self._written()
+
+    def touch(self, uid):
+        """
+        Mark the document as seen in the current run.
+        """
+        self._conn.execute('UPDATE results SET run = ? WHERE uid = ?', (self.run, uid))
+        self._written()
+
+    def prune(self) -> int:
+        """
+        Remove the documents not seen in the current run.
+        @return: number of removed documents
+        """
+        removed = self._conn.execute('DELETE FROM results WHERE run < ?', (self.run,)).rowcount
+        self._conn.commit()
+        return removed
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def _written(self):
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_INTERVAL:
+            self._conn.commit()
+            self._uncommitted = 0
+
+def incremental(apiWrapFunc, store, resultClass, prune=False):
+    """
+    Wrap an API function so that it is called only for documents which are new or changed since the last run.
+    A document is unchanged if the fingerprint of its API input (text, title, lead, language, options etc.)
+    and of the API URL is the same as stored for its ID. Results of unchanged documents are taken from the store,
+    other results are stored unless they are exceptions. The wrapped function has to return the results
+    in the input order.
+
+    @param apiWrapFunc: function (document iterable, flags, **kwargs) -> iterable of API call results,
+        e.g. entities.getEntities
+    @param store: FingerprintStore
+    @param resultClass: class of the results with the fromDict() method, e.g. entities.EntitiesResponse;
+        results stored for another class are not used
+    @param prune: if true, documents not seen in this run are removed from the store after all the results
+        were generated
+    @return: function with the same signature as apiWrapFunc
+    """
+    def wrapped(docs, flags, **kwargs):
+        returnInputs = kwargs.get('returnInputs')
+        kind = resultClass.__name__
+        called = deque()
+
+        def storedResult(uid, docFingerprint):
+            stored = store.get(uid)
+            if stored is None or stored[0] != docFingerprint or stored[1] != kind:
+                return None
+            try:
+                return resultClass.fromDict(stored[2])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning('stored result of document %s does not match %s (%r), calling the API again',
+                        uid, kind, e)
+                return None
+
+        def lookup(doc):
+            apiInput = S2ApiInput.fromDocAndFlags(doc, flags)
+            docFingerprint = fingerprint(apiInput, kwargs.get('url'))
+            result = storedResult(doc.uid, docFingerprint)
+            if result is None:
+                called.append((doc.uid, docFingerprint))
+                return None
+
+            store.touch(doc.uid)
+            return (lambda: (apiInput, result)) if returnInputs else (lambda: result)
+
+        def callFunc(changedDocs):
+            for result in apiWrapFunc(changedDocs, flags, **kwargs):
+                uid, docFingerprint = called.popleft()
+                value = result[1] if returnInputs else result
+                if not isinstance(value, Exception):
+                    store.put(uid, docFingerprint, kind, toPlain(value))
+                yield result
+
+        yield from restutil.mergedCalls(docs, lookup, callFunc)
+        if prune:
+            store.prune()
+
+    return wrapped
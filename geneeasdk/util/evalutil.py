@@ -0,0 +1,327 @@
+# coding=utf-8
+
+"""
+Evaluation of API results against expected ('true') values.
+
+The evaluations accumulate the per-document values into compact arrays and compute the metrics over whole
+arrays, using NumPy when it is installed. Partial evaluations (e.g. of sharded runs) can be saved, loaded
+and merged.
+"""
+
+import json
+import math
+import random
+
+from array import array
+from collections import Counter, namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DEFAULT_BOOTSTRAP_SAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+
+ClassStats = namedtuple('ClassStats', ['precision', 'recall', 'f1', 'support'])
+
+def _f1Score(precision, recall):
+    return 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+class Evaluation:
+    """
+    Base class of the evaluations. An evaluation has a column (array) for each per-document value.
+    """
+    kind = None
+    metrics = ()
+    _typecodes = ()
+
+    def __init__(self):
+        self._data = [array(typecode) for typecode in self._typecodes]
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def columns(self):
+        """
+        @return: list of columns, NumPy arrays if NumPy is available, lists otherwise
+        """
+        if np is not None:
+            return [np.array(col, dtype=col.typecode) for col in self._data]
+        return [list(col) for col in self._data]
+
+    def metric(self, name, columns=None) -> float:
+        """
+        @param name: name of the metric, one of self.metrics
+        @param columns: columns to compute the metric for, all the data by default
+        @return: value of the metric
+        """
+        if name not in self.metrics:
+            raise ValueError('unknown metric {}, use one of {}'.format(name, self.metrics))
+        return getattr(self, '_' + name)(self.columns() if columns is None else columns)
+
+    def bootstrap(self, name, samples=DEFAULT_BOOTSTRAP_SAMPLES, confidence=DEFAULT_CONFIDENCE, seed=None):
+        """
+        Estimate a confidence interval of a metric by bootstrapping, i.e. by computing the metric
+        for samples of documents drawn with replacement.
+        @param name: name of the metric
+        @param samples: number of samples
+        @param confidence: confidence level of the interval
+        @param seed: random seed
+        @return: tuple (low, high)
+        """
+        count = len(self)
+        if not count:
+            return (0.0, 0.0)
+        if np is not None:
+            rng = np.random.default_rng(seed)
+            drawIndices = lambda: rng.integers(0, count, count)
+        else:
+            rnd = random.Random(seed)
+            drawIndices = lambda: [rnd.randrange(count) for _ in range(count)]
+
+        columns = self.columns()
+        if np is not None:
+            select = lambda indices: [col[indices] for col in columns]
+        else:
+            select = lambda indices: [[col[i] for i in indices] for col in columns]
+        values = sorted(self.metric(name, select(drawIndices())) for _ in range(samples))
+        alpha = (1 - confidence) / 2
+        return values[int(alpha * (samples - 1))], values[int(round((1 - alpha) * (samples - 1)))]
+
+    def merge(self, other):
+        """
+        Add the documents of another evaluation of the same kind to this one.
+        @return: self
+        """
+        if type(other) is not type(self):
+            raise TypeError('cannot merge {} into {}'.format(type(other).__name__, type(self).__name__))
+        for col, otherCol in zip(self._data, other._data):
+            col.extend(otherCol)
+        return self
+
+    def state(self) -> dict:
+        """
+        @return: JSON-serializable state of the evaluation, see fromState()
+        """
+        return {'kind': self.kind, 'columns': [col.tolist() for col in self._data]}
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as stateFile:
+            json.dump(self.state(), stateFile)
+
+    def report(self, bootstrapSamples=0) -> str:
+        """
+        @param bootstrapSamples: number of bootstrap samples for confidence intervals, zero for no intervals
+        @return: human readable report of all the metrics
+        """
+        lines = ['documents: {}'.format(len(self))]
+        for name in self.metrics:
+            line = '{}: {:.4f}'.format(name, self.metric(name))
+            if bootstrapSamples:
+                low, high = self.bootstrap(name, samples=bootstrapSamples)
+                line += ' ({:.0%} CI {:.4f} - {:.4f})'.format(DEFAULT_CONFIDENCE, low, high)
+            lines.append(line)
+        return '\n'.join(lines)
+
+class ClassificationEval(Evaluation):
+    """
+    Evaluation of single-label classification, e.g. language detection or topic.
+    """
+    kind = 'classification'
+    metrics = ('accuracy', 'macroF1')
+    _typecodes = ('l', 'l')
+
+    def __init__(self):
+        super().__init__()
+        self.labels = []
+        self._labelIds = {}
+
+    def _labelId(self, label):
+        labelId = self._labelIds.get(label)
+        if labelId is None:
+            labelId = self._labelIds[label] = len(self.labels)
+            self.labels.append(label)
+        return labelId
+
+    def add(self, trueLabel, predictedLabel):
+        self._data[0].append(self._labelId(trueLabel))
+        self._data[1].append(self._labelId(predictedLabel))
+
+    def confusionMatrix(self, columns=None):
+        """
+        @return: matrix (NumPy array or list of lists) of counts; rows are true labels, columns predicted labels,
+            both in the order of self.labels
+        """
+        trueIds, predIds = self.columns() if columns is None else columns
+        n = len(self.labels)
+        if np is not None:
+            return np.bincount(trueIds * n + predIds, minlength=n * n).reshape(n, n)
+        matrix = [[0] * n for _ in range(n)]
+        for (trueId, predId), count in Counter(zip(trueIds, predIds)).items():
+            matrix[trueId][predId] = count
+        return matrix
+
+    def _counts(self, columns):
+        """
+        @return: tuple (true positives, predicted counts, true counts), each a sequence indexed by label ID
+        """
+        matrix = self.confusionMatrix(columns)
+        if np is not None:
+            return np.diag(matrix), matrix.sum(axis=0), matrix.sum(axis=1)
+        return ([matrix[i][i] for i in range(len(matrix))], [sum(col) for col in zip(*matrix)],
+                [sum(row) for row in matrix])
+
+    def classStats(self, columns=None) -> dict:
+        """
+        @return: dictionary label -> ClassStats
+        """
+        truePositives, predicted, actual = self._counts(self.columns() if columns is None else columns)
+        stats = {}
+        for labelId, label in enumerate(self.labels):
+            precision = _ratio(truePositives[labelId], predicted[labelId])
+            recall = _ratio(truePositives[labelId], actual[labelId])
+            stats[label] = ClassStats(precision, recall, _f1Score(precision, recall), int(actual[labelId]))
+        return stats
+
+    def _accuracy(self, columns):
+        trueIds, predIds = columns
+        if np is not None:
+            return float((trueIds == predIds).mean()) if len(trueIds) else 0.0
+        return _ratio(sum(t == p for t, p in zip(trueIds, predIds)), len(trueIds))
+
+    def _macroF1(self, columns):
+        truePositives, predicted, actual = self._counts(columns)
+        if np is not None:
+            present = actual > 0
+            if not present.any():
+                return 0.0
+            precision = np.divide(truePositives, predicted, out=np.zeros(len(predicted)), where=predicted > 0)
+            recall = np.divide(truePositives, actual, out=np.zeros(len(actual)), where=present)
+            denominator = precision + recall
+            f1 = np.divide(2 * precision * recall, denominator, out=np.zeros(len(denominator)), where=denominator > 0)
+            return float(f1[present].mean())
+        f1s = [_f1Score(_ratio(tp, pred), _ratio(tp, act))
+               for tp, pred, act in zip(truePositives, predicted, actual) if act]
+        return _ratio(sum(f1s), len(f1s))
+
+    def merge(self, other):
+        if type(other) is not type(self):
+            raise TypeError('cannot merge {} into {}'.format(type(other).__name__, type(self).__name__))
+        idMap = [self._labelId(label) for label in other.labels]
+        for col, otherCol in zip(self._data, other._data):
+            col.extend(idMap[labelId] for labelId in otherCol)
+        return self
+
+    def state(self):
+        state = super().state()
+        state['labels'] = self.labels
+        return state
+
+    def report(self, bootstrapSamples=0):
+        lines = [super().report(bootstrapSamples), 'label\tprecision\trecall\tf1\tsupport']
+        for label, stats in sorted(self.classStats().items(), key=lambda item: -item[1].support):
+            lines.append('{}\t{:.4f}\t{:.4f}\t{:.4f}\t{}'.format(label, *stats))
+        return '\n'.join(lines)
+
+class RegressionEval(Evaluation):
+    """
+    Evaluation of numerical predictions, e.g. sentiment.
+    """
+    kind = 'regression'
+    metrics = ('mae', 'pearson')
+    _typecodes = ('d', 'd')
+
+    def add(self, trueValue, predictedValue):
+        self._data[0].append(float(trueValue))
+        self._data[1].append(float(predictedValue))
+
+    def _mae(self, columns):
+        trueVals, predVals = columns
+        if np is not None:
+            return float(np.abs(trueVals - predVals).mean()) if len(trueVals) else 0.0
+        return _ratio(sum(abs(t - p) for t, p in zip(trueVals, predVals)), len(trueVals))
+
+    def _pearson(self, columns):
+        trueVals, predVals = columns
+        count = len(trueVals)
+        if count < 2:
+            return 0.0
+        if np is not None:
+            trueDev, predDev = trueVals - trueVals.mean(), predVals - predVals.mean()
+            covariance, trueVar, predVar = (trueDev * predDev).sum(), (trueDev ** 2).sum(), (predDev ** 2).sum()
+        else:
+            trueMean, predMean = sum(trueVals) / count, sum(predVals) / count
+            trueDev = [t - trueMean for t in trueVals]
+            predDev = [p - predMean for p in predVals]
+            covariance = sum(t * p for t, p in zip(trueDev, predDev))
+            trueVar, predVar = sum(t * t for t in trueDev), sum(p * p for p in predDev)
+        return float(_ratio(covariance, math.sqrt(trueVar * predVar)))
+
+class MatchEval(Evaluation):
+    """
+    Evaluation of predicted items (e.g. entity spans or tags) matched against true items. Precision, recall
+    and F1 are micro-averaged over all the documents.
+    """
+    kind = 'match'
+    metrics = ('precision', 'recall', 'f1')
+    _typecodes = ('l', 'l', 'l')
+
+    def add(self, trueItems, predictedItems):
+        """
+        @param trueItems: iterable of hashable true items of a document
+        @param predictedItems: iterable of hashable predicted items of a document
+        """
+        trueCounts, predCounts = Counter(trueItems), Counter(predictedItems)
+        self.addCounts(sum((trueCounts & predCounts).values()), sum(predCounts.values()), sum(trueCounts.values()))
+
+    def addCounts(self, matched, predicted, actual):
+        """
+        @param matched: number of correctly predicted items of a document
+        @param predicted: number of predicted items
+        @param actual: number of true items
+        """
+        self._data[0].append(matched)
+        self._data[1].append(predicted)
+        self._data[2].append(actual)
+
+    def _sums(self, columns):
+        return [int(sum(col)) for col in columns]
+
+    def _precision(self, columns):
+        matched, predicted, _ = self._sums(columns)
+        return _ratio(matched, predicted)
+
+    def _recall(self, columns):
+        matched, _, actual = self._sums(columns)
+        return _ratio(matched, actual)
+
+    def _f1(self, columns):
+        matched, predicted, actual = self._sums(columns)
+        return _f1Score(_ratio(matched, predicted), _ratio(matched, actual))
+
+_EVALUATIONS = {cls.kind: cls for cls in (ClassificationEval, RegressionEval, MatchEval)}
+
+def fromState(state) -> Evaluation:
+    """
+    @param state: state returned by Evaluation.state()
+    @return: evaluation with given state
+    """
+    evaluation = _EVALUATIONS[state['kind']]()
+    if 'labels' in state:
+        for label in state['labels']:
+            evaluation._labelId(label)
+    for col, values in zip(evaluation._data, state['columns']):
+        col.extend(values)
+    return evaluation
+
+def load(path) -> Evaluation:
+    """
+    @param path: file written by Evaluation.save()
+    @return: the saved evaluation
+    """
+    with open(path, encoding='utf-8') as stateFile:
+        return fromState(json.load(stateFile))
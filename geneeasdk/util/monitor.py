@@ -0,0 +1,105 @@
+# coding=utf-8
+
+"""
+Monitoring of memory and throughput of processing pipelines
+"""
+
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+def currentRss():
+    """
+    @return: resident set size of the current process in bytes, or None if it is not available (i.e. outside Linux)
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def peakRss() -> int:
+    """
+    @return: peak resident set size of the current process in bytes, or 0 if it is not available
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxRss if sys.platform == 'darwin' else maxRss * 1024
+
+def _rssStr() -> str:
+    rss = currentRss()
+    if rss is None:
+        return 'peak RSS {:.1f} MB'.format(peakRss() / 2**20)
+    return 'RSS {:.1f} MB'.format(rss / 2**20)
+
+class PipelineMonitor:
+    """
+    Monitor of a pipeline processing items, e.g. restutil.parallelMap(). It periodically reports
+    the throughput, memory and in-flight data, and tells the pipeline to stop reading new inputs
+    while the RSS exceeds the configured ceiling.
+
+    The ceiling needs the current RSS, which is available only on Linux; elsewhere it is disabled
+    with a warning, since the peak RSS never drops below the ceiling once it is exceeded.
+    """
+
+    def __init__(self, reportInterval=None, maxRss=None, output=sys.stderr):
+        """
+        @param reportInterval: seconds between reports, or None for no reports
+        @param maxRss: RSS ceiling in bytes, or None
+        @param output: file the reports are written to
+        """
+        if maxRss is not None and currentRss() is None:
+            logger.warning('the current RSS is not available on this platform, the RSS ceiling is ignored')
+            maxRss = None
+        self.reportInterval = reportInterval
+        self.maxRss = maxRss
+        self.output = output
+
+        self.items = 0
+        self.bytes = 0
+        self.throttleCount = 0
+        self._startTime = self._lastReport = time.time()
+
+    def overMemory(self) -> bool:
+        """
+        @return: True if the RSS exceeds the ceiling
+        """
+        return self.maxRss is not None and currentRss() > self.maxRss
+
+    def throttled(self, inFlightBytes):
+        """
+        Record that the pipeline stopped reading new inputs because of a memory limit.
+        """
+        if not self.throttleCount:
+            logger.warning('memory budget reached (%d bytes in flight, %s), throttling input',
+                    inFlightBytes, _rssStr())
+        self.throttleCount += 1
+
+    def itemDone(self, size, inFlightBytes):
+        """
+        Record a processed item and report if the report interval elapsed.
+        @param size: size of the item in bytes
+        @param inFlightBytes: size of items submitted, but not yet returned
+        """
+        self.items += 1
+        self.bytes += size
+        now = time.time()
+        if self.reportInterval is not None and now - self._lastReport >= self.reportInterval:
+            self._lastReport = now
+            self.report(inFlightBytes)
+
+    def report(self, inFlightBytes=0):
+        elapsed = max(time.time() - self._startTime, 1e-9)
+        print('{time}: {items} items ({itemRate:.1f}/s, {byteRate:.0f} B/s), {inFlight} B in flight, '
+              '{rss}, throttled {throttled}x'.format(
+                time=time.strftime('%H:%M:%S'), items=self.items, itemRate=self.items / elapsed,
+                byteRate=self.bytes / elapsed, inFlight=inFlightBytes, rss=_rssStr(),
+                throttled=self.throttleCount),
+              file=self.output)
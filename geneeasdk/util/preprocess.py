@@ -0,0 +1,240 @@
+# coding=utf-8
+
+"""
+Client-side preprocessing of documents reducing the size of API inputs
+"""
+
+import html
+import re
+
+from bisect import bisect_right
+from collections import deque, namedtuple
+
+from geneeasdk.util import restutil
+from geneeasdk.util.restutil import S2ApiInput
+
+# fields of Document which are preprocessed
+TEXT_FIELDS = ('text', 'title', 'lead')
+
+_IGNORED_ELEMENT_REGEX = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_HTML_REGEX = re.compile(r'<!--.*?-->|<[a-zA-Z/!][^>]*>|&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);',
+        re.DOTALL)
+_WHITESPACE_REGEX = re.compile(r'\s+')
+
+class EmptyDocument(Exception):
+    """
+    Returned as the result of a document dropped because it was empty after preprocessing.
+    """
+
+PreprocessedDocument = namedtuple('PreprocessedDocument', ['document', 'offsetMaps'])
+"""
+A preprocessed document with a dictionary field name -> OffsetMap for each changed text field.
+"""
+
+PreprocessStats = namedtuple('PreprocessStats', ['documents', 'dropped', 'bytesBefore', 'bytesAfter'])
+"""
+Statistics of preprocessing: number of documents, number of dropped documents and UTF-8 sizes
+of the text fields before and after preprocessing.
+"""
+
+class OffsetMap:
+    """
+    Mapping of character offsets in a preprocessed text to offsets in the original text.
+    It consists of layers, one for each text transformation. A layer is a list of segments of the transformed
+    text: a segment either is a copy of the original text, or it replaced a part of the original text,
+    in which case all its offsets are mapped to the start of the replaced part.
+    """
+
+    def __init__(self):
+        self._layers = []
+
+    def __bool__(self):
+        return bool(self._layers)
+
+    def addLayer(self, newStarts, origStarts, copied):
+        """
+        @param newStarts: sorted start offsets of the segments in the transformed text
+        @param origStarts: start offsets of the corresponding parts of the original text
+        @param copied: flags whether the segments are copies of the original text
+        """
+        self._layers.append((newStarts, origStarts, copied))
+
+    def toOriginal(self, offset) -> int:
+        """
+        @param offset: character offset in the preprocessed text
+        @return: corresponding offset in the original text
+        """
+        for newStarts, origStarts, copied in reversed(self._layers):
+            i = bisect_right(newStarts, offset) - 1
+            if i < 0:
+                continue
+            offset = origStarts[i] + (offset - newStarts[i] if copied[i] else 0)
+        return offset
+
+    def toOriginalSpan(self, offset, length):
+        """
+        @return: tuple (start, end) of the original text corresponding to given span of the preprocessed text
+        """
+        if length <= 0:
+            start = self.toOriginal(offset)
+            return start, start
+        return self.toOriginal(offset), self.toOriginal(offset + length - 1) + 1
+
+def _substitute(text, regex, replace, offsetMap):
+    """
+    Replace all matches of a regex in the text and record the changes into the offset map.
+    @param replace: function match -> replacement string
+    @return: the new text
+    """
+    pieces, newStarts, origStarts, copied = [], [], [], []
+    pos = newPos = 0
+
+    def addSegment(segment, origStart, isCopy):
+        nonlocal newPos
+        if segment:
+            pieces.append(segment)
+            newStarts.append(newPos)
+            origStarts.append(origStart)
+            copied.append(isCopy)
+            newPos += len(segment)
+
+    for match in regex.finditer(text):
+        addSegment(text[pos:match.start()], pos, True)
+        addSegment(replace(match), match.start(), False)
+        pos = match.end()
+    if pos == 0:
+        return text
+    addSegment(text[pos:], pos, True)
+
+    offsetMap.addLayer(newStarts, origStarts, copied)
+    return ''.join(pieces)
+
+def stripHtml(text, offsetMap):
+    """
+    Remove HTML elements and comments (contents of script and style elements too) and decode character references.
+    """
+    text = _substitute(text, _IGNORED_ELEMENT_REGEX, lambda m: ' ', offsetMap)
+    return _substitute(text, _HTML_REGEX,
+            lambda m: html.unescape(m.group()) if m.group().startswith('&') else ' ', offsetMap)
+
+def collapseWhitespace(text, offsetMap):
+    """
+    Replace whitespace sequences by a single space and strip leading and trailing whitespace.
+    """
+    return _substitute(text, _WHITESPACE_REGEX,
+            lambda m: '' if m.start() == 0 or m.end() == len(m.string) else ' ', offsetMap)
+
+def truncate(text, maxChars):
+    """
+    Truncate the text to at most maxChars characters, preferably at a whitespace. Offsets are not changed.
+    """
+    if len(text) <= maxChars:
+        return text
+    cut = text.rfind(' ', 0, maxChars + 1)
+    return text[:cut if cut > maxChars // 2 else maxChars]
+
+class Preprocessor:
+    """
+    Configurable preprocessing of the text fields of documents (text, title and lead).
+    The transformations are applied in the order: HTML stripping, whitespace collapsing, truncation.
+    """
+
+    def __init__(self, stripHtml=False, collapseWhitespace=False, maxChars=None, dropEmpty=False):
+        """
+        @param stripHtml: remove HTML markup
+        @param collapseWhitespace: collapse whitespace sequences to a single space
+        @param maxChars: maximal number of characters of each text field, or None
+        @param dropEmpty: drop documents whose text fields are all empty after preprocessing
+        """
+        self.stripHtml = stripHtml
+        self.collapseWhitespace = collapseWhitespace
+        self.maxChars = maxChars
+        self.dropEmpty = dropEmpty
+        self.stats = PreprocessStats(0, 0, 0, 0)
+
+    def processText(self, text):
+        """
+        @return: tuple (preprocessed text, OffsetMap)
+        """
+        offsetMap = OffsetMap()
+        if self.stripHtml:
+            text = stripHtml(text, offsetMap)
+        if self.collapseWhitespace:
+            text = collapseWhitespace(text, offsetMap)
+        if self.maxChars is not None:
+            text = truncate(text, self.maxChars)
+        return text, offsetMap
+
+    def process(self, document):
+        """
+        @param document: Document
+        @return: PreprocessedDocument, or None if the document is dropped
+        """
+        changes, offsetMaps = {}, {}
+        bytesBefore = bytesAfter = 0
+        for field in TEXT_FIELDS:
+            text = getattr(document, field)
+            if not text:
+                continue
+            newText, offsetMap = self.processText(text)
+            bytesBefore += len(text.encode('utf-8'))
+            bytesAfter += len(newText.encode('utf-8'))
+            if newText != text:
+                changes[field] = newText
+            if offsetMap:
+                offsetMaps[field] = offsetMap
+
+        document = document._replace(**changes)
+        dropped = self.dropEmpty and not any(getattr(document, field) for field in TEXT_FIELDS)
+        documents, droppedCount, allBytesBefore, allBytesAfter = self.stats
+        self.stats = PreprocessStats(documents + 1, droppedCount + int(dropped),
+                allBytesBefore + bytesBefore, allBytesAfter + (0 if dropped else bytesAfter))
+        return None if dropped else PreprocessedDocument(document, offsetMaps)
+
+def preprocessed(apiWrapFunc, preprocessor, remapFunc=None):
+    """
+    Wrap an API function so that the documents are preprocessed before the call. Dropped documents are not sent
+    to the API, EmptyDocument is returned as their result (even if failFast is true), so that the results
+    stay aligned with the input documents. The wrapped function has to return the results in the input order.
+
+    @param apiWrapFunc: function (document iterable, flags, **kwargs) -> iterable of API call results
+    @param preprocessor: Preprocessor
+    @param remapFunc: function (API call result, dictionary field -> OffsetMap) -> result with offsets
+        in the original texts, e.g. entities.remapOffsets, or None
+    @return: function with the same signature as apiWrapFunc
+    """
+    def wrapped(docs, flags, **kwargs):
+        returnInputs = kwargs.get('returnInputs')
+        # documents to be called, lookup() adds a document right before it is passed to callFunc()
+        processedQueue = deque()
+        offsetMapQueue = deque()
+
+        def lookup(doc):
+            processed = preprocessor.process(doc)
+            if processed is not None:
+                processedQueue.append(processed)
+                return None
+
+            def droppedResult():
+                error = EmptyDocument('document {} is empty after preprocessing'.format(doc.uid))
+                return (S2ApiInput.fromDocAndFlags(doc, flags), error) if returnInputs else error
+            return droppedResult
+
+        def callFunc(calledDocs):
+            def processedDocs():
+                for _ in calledDocs:
+                    processed = processedQueue.popleft()
+                    offsetMapQueue.append(processed.offsetMaps)
+                    yield processed.document
+
+            for result in apiWrapFunc(processedDocs(), flags, **kwargs):
+                offsetMaps = offsetMapQueue.popleft()
+                value = result[1] if returnInputs else result
+                if remapFunc is not None and offsetMaps and not isinstance(value, Exception):
+                    value = remapFunc(value, offsetMaps)
+                    result = (result[0], value) if returnInputs else value
+                yield result
+
+        return restutil.mergedCalls(docs, lookup, callFunc)
+
+    return wrapped
@@ -0,0 +1,147 @@
+# coding=utf-8
+
+"""
+Recording of API traffic and its offline replay, e.g. for deterministic load tests
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from collections import namedtuple
+
+from geneeasdk.util.restutil import HttpTransport, TransportResponse
+
+FLUSH_INTERVAL = 1000
+FLUSH_SECONDS = 5.0
+
+CallRecord = namedtuple('CallRecord', ['url', 'input', 'response', 'latency', 'status'])
+"""
+A recorded API call: URL, serialized input, raw response (or the error message if the call failed),
+latency in seconds and HTTP status (None if no response was received).
+"""
+
+class ReplayedError(Exception):
+    """
+    Replayed failure of a recorded call.
+    """
+
+    def __init__(self, status, message):
+        super().__init__('replayed failure (status {}): {}'.format(status, message))
+        self.status = status
+
+def _openLog(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def readLog(path):
+    """
+    @param path: call log written by RecordingTransport, gzipped if its name ends with .gz
+    @return: generator of CallRecord instances
+    """
+    with _openLog(path, 'r') as log:
+        for line in log:
+            if line.strip():
+                yield CallRecord(*json.loads(line))
+
+def _callKey(url, data):
+    return hashlib.blake2b('{}\n{}'.format(url, data).encode('utf-8'), digest_size=16).digest()
+
+class RecordingTransport:
+    """
+    Transport recording all calls to an append-only log of JSON lines (see CallRecord). The log is compressed
+    if the path ends with .gz. API keys are not recorded.
+
+    The log is flushed every FLUSH_INTERVAL records or FLUSH_SECONDS seconds and when it is closed;
+    flushing of every record would defeat the compression.
+    """
+
+    def __init__(self, path, transport=None):
+        """
+        @param path: path of the log
+        @param transport: transport performing the calls, HttpTransport() by default
+        """
+        self.transport = transport if transport is not None else HttpTransport()
+        self._log = _openLog(path, 'a')
+        self._lock = threading.Lock()
+        self._unflushed = 0
+        self._lastFlush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def __call__(self, url, headers, data, timeout) -> TransportResponse:
+        startTime = time.monotonic()
+        try:
+            response = self.transport(url, headers, data, timeout)
+        except Exception as e:
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            self._write(CallRecord(url, data, str(e), time.monotonic() - startTime, status))
+            raise
+        self._write(CallRecord(url, data, response.text, time.monotonic() - startTime, response.status))
+        return response
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._log.write(line + '\n')
+            self._unflushed += 1
+            now = time.monotonic()
+            if self._unflushed >= FLUSH_INTERVAL or now - self._lastFlush >= FLUSH_SECONDS:
+                self._log.flush()
+                self._unflushed = 0
+                self._lastFlush = now
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+
+class ReplayTransport:
+    """
+    Transport serving responses from a log written by RecordingTransport, without calling the API.
+    A call is answered by a recorded call with the same URL and serialized input; if the input was recorded
+    several times, its responses are served in turn.
+
+    Latencies of the recorded calls are reproduced (divided by speed), or the responses are served
+    immediately if speed is None.
+    """
+
+    def __init__(self, path, speed=1.0, sleep=time.sleep):
+        """
+        @param path: path of the log
+        @param speed: latency scaling factor: 2.0 means twice as fast as recorded; None means no delays
+        @param sleep: function used for waiting
+        """
+        self.speed = speed
+        self._sleep = sleep
+        self._records = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        for record in readLog(path):
+            key = _callKey(record.url, record.input)
+            self._records.setdefault(key, []).append((record.response, record.latency, record.status))
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.values())
+
+    def __call__(self, url, headers, data, timeout) -> TransportResponse:
+        key = _callKey(url, data)
+        records = self._records.get(key)
+        if not records:
+            raise LookupError('no recorded call for URL {} and given input'.format(url))
+        with self._lock:
+            count = self._counters.get(key, 0)
+            self._counters[key] = count + 1
+        response, latency, status = records[count % len(records)]
+
+        if self.speed:
+            self._sleep(latency / self.speed)
+        if status is None or status >= 400:
+            raise ReplayedError(status, response)
+        return TransportResponse(status, response)
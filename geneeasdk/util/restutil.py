@@ -4,17 +4,18 @@
 Functions related to calling REST APIs
 """
 
-import requests
-
 import itertools
 import json
+import os
+import threading
 import time
 
 from collections import ChainMap, deque, namedtuple
-from concurrent.futures import ThreadPoolExecutor
 from operator import itemgetter
 from itertools import islice
 
+from geneeasdk.util import trace
+
 REQUEST_MAX_SIZE = 1024 * 1024
 DEFAULT_BATCH_SIZE = 10
 
@@ -64,8 +65,20 @@ def s2ApiInputStream(docs, flags):
     @param flags: additional API parameters
     @return: iterable of S2ApiInput objects
     """
+    tracer = trace.getTracer()
+    if tracer.enabled:
+        return _tracedS2ApiInputStream(docs, flags, tracer)
     return map(S2ApiInput.fromDocAndFlags, docs, itertools.repeat(flags))
 
+def _tracedS2ApiInputStream(docs, flags, tracer):
+    for doc in docs:
+        start = tracer.now()
+        inputObj = S2ApiInput.fromDocAndFlags(doc, flags)
+        tracer.add('input', start, traceId=doc.uid)
+        # the input does not contain the uid, the following stages find the trace ID by the input object
+        tracer.bind(inputObj, doc.uid)
+        yield inputObj
+
 def documentInput(document):
     """
     @param document: the input Document
@@ -87,8 +100,152 @@ def errorMsg(error):
     """
     return "Error: {type}: {text}".format(type=type(error), text=error)
 
+RateLimit = namedtuple('RateLimit', ['amount', 'period'])
+"""
+Limit of at most `amount` units (calls or characters) per `period` seconds.
+"""
+
+RateLimiterStats = namedtuple('RateLimiterStats', ['calls', 'chars', 'waitTime', 'maxWait'])
+"""
+Statistics of a rate limiter: number of acquired calls and characters, total and maximal time
+in seconds the callers waited.
+"""
+
+class RateLimitExceeded(ValueError):
+    """
+    Raised by RateLimiter.acquire() for a call which exceeds a whole budget, i.e. which could never be made.
+    """
+
+class RateLimiter:
+    """
+    Client-side rate limiter for API calls with separate budgets for each API key and endpoint URL.
+    Both the number of calls and the number of sent characters can be limited.
+
+    The budgets are token buckets implemented as a generic cell rate algorithm: each bucket
+    is represented by its theoretical arrival time. Every acquire() reserves its tokens immediately
+    and then sleeps until they are available, so the callers are served strictly in the order of arrival
+    and no thread or job can starve the others.
+
+    If stateFile is given, the buckets are stored in that file and guarded by an exclusive file lock,
+    so that all local processes using the same file share the same budget (requires fcntl, i.e. a POSIX system).
+    """
+
+    def __init__(self, callLimit=None, charLimit=None, stateFile=None, sleep=time.sleep):
+        """
+        @param callLimit: RateLimit of the number of calls or None
+        @param charLimit: RateLimit of the number of sent characters or None
+        @param stateFile: path of the file shared by multiple processes or None
+        @param sleep: function used for waiting
+        """
+        self._limits = {name: limit for name, limit in (('calls', callLimit), ('chars', charLimit)) if limit}
+        self._stateFile = stateFile
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._stats = RateLimiterStats(0, 0, 0.0, 0.0)
+
+    @property
+    def stats(self) -> RateLimiterStats:
+        return self._stats
+
+    def acquire(self, key, url, chars=0) -> float:
+        """
+        Wait until the budget allows a call with given number of characters.
+        @param key: user API key
+        @param url: called URL
+        @param chars: number of characters sent by the call
+        @return: time in seconds the caller waited
+        @raise RateLimitExceeded: if the call exceeds a whole budget
+        """
+        amounts = {'calls': 1, 'chars': chars}
+        for name, limit in self._limits.items():
+            if amounts[name] > limit.amount:
+                raise RateLimitExceeded('the call needs {} {}, but the limit is {} per {} seconds'.format(
+                        amounts[name], name, limit.amount, limit.period))
+
+        with self._lock:
+            if self._stateFile:
+                wait = self._reserveShared(key, url, amounts)
+            else:
+                wait = self._reserve(self._buckets.setdefault((key, url), {}), amounts, time.time())
+            calls, allChars, waitTime, maxWait = self._stats
+            self._stats = RateLimiterStats(calls + 1, allChars + chars, waitTime + wait, max(maxWait, wait))
+
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def _reserve(self, bucket, amounts, now):
+        """
+        Reserve tokens in given bucket (a dict: limit name -> theoretical arrival time).
+        @return: the time to wait
+        """
+        wait = 0.0
+        for name, limit in self._limits.items():
+            tat = max(bucket.get(name, now), now) + amounts[name] * limit.period / limit.amount
+            bucket[name] = tat
+            wait = max(wait, tat - limit.period - now)
+        return wait
+
+    def _reserveShared(self, key, url, amounts):
+        if not self._limits:
+            # nothing to share, the buckets would be empty
+            return 0.0
+        import fcntl
+        import hashlib
+
+        # the key is not stored in the shared file
+        bucketId = hashlib.sha1('{}\n{}'.format(key, url).encode('utf-8')).hexdigest()[:16]
+
+        with open(self._stateFile, 'a+', encoding='utf-8') as stateFile:
+            fcntl.flock(stateFile, fcntl.LOCK_EX)
+            try:
+                stateFile.seek(0)
+                content = stateFile.read()
+                state = json.loads(content) if content else {}
+                now = time.time()
+                # forget buckets which are full again
+                state = {bId: b for bId, b in state.items() if b and max(b.values()) > now}
+                wait = self._reserve(state.setdefault(bucketId, {}), amounts, now)
+                stateFile.seek(0)
+                stateFile.truncate()
+                json.dump(state, stateFile)
+                stateFile.flush()
+            finally:
+                fcntl.flock(stateFile, fcntl.LOCK_UN)
+        return wait
+
+TransportResponse = namedtuple('TransportResponse', ['status', 'text'])
+"""
+Raw response of a successful HTTP call: status code and decoded body.
+"""
+
+class HttpTransport:
+    """
+    Transport of API calls over HTTP. A transport is a callable (url, headers, data, timeout) -> TransportResponse
+    raising an exception if the call fails.
+    """
+
+    def __init__(self, session=None):
+        """
+        @param session: requests.Session used for the calls, allows reusing connections; if None,
+            a new connection is opened for each call
+        """
+        self.session = session
+
+    def __call__(self, url, headers, data, timeout) -> TransportResponse:
+        # imported lazily, so that modules using only the data structures defined here start up fast
+        import requests
+        post = self.session.post if self.session is not None else requests.post
+
+        resp = post(url, headers=headers, data=data, timeout=timeout)
+        resp.raise_for_status()
+        resp.encoding = 'utf-8'
+        return TransportResponse(resp.status_code, resp.text)
+
 def remoteCall(url, inputData, key=None, serialize=json.dumps, deserialize=json.loads,
-        connectTimeout=DEFAULT_CONNECT_TIMEOUT, readTimeout=DEFAULT_READ_TIMEOUT):
+        connectTimeout=DEFAULT_CONNECT_TIMEOUT, readTimeout=DEFAULT_READ_TIMEOUT, session=None, rateLimiter=None,
+        transport=None):
     """
     Call REST API on specified URL with specified parameters.
     @param url: URL to call
@@ -98,21 +255,44 @@ def remoteCall(url, inputData, key=None, serialize=json.dumps, deserialize=json.
     @param deserialize: function str -> output data object
     @param connectTimeout: connection timeout see: http://docs.python-requests.org/en/latest/user/advanced/#timeouts
     @param readTimeout: read timeout see: http://docs.python-requests.org/en/latest/user/advanced/#timeouts
+    @param session: requests.Session used for the call, allows reusing connections; if None,
+        a new connection is opened
+    @param rateLimiter: RateLimiter delaying the call according to the budget of the key and URL, or None
+    @param transport: transport performing the call (see HttpTransport), e.g. replay.RecordingTransport;
+        HttpTransport(session) by default
     @return: deserialized API response or Exception in case of any error
     """
     headers = {'Content-Type': 'application/json; charset=UTF-8'}
     if key:
         headers['Authorization'] = 'user_key ' + key
+    if transport is None:
+        transport = HttpTransport(session)
+    tracer = trace.getTracer()
 
     try:
-        resp = requests.post(url, headers=headers, data=serialize(inputData), timeout=(connectTimeout, readTimeout))
-        resp.raise_for_status()
-        resp.encoding = 'utf-8'
-        return deserialize(resp.text)
+        data = serialize(inputData)
+        if rateLimiter is not None:
+            with tracer.span('rateLimit'):
+                rateLimiter.acquire(key, url, len(data))
+        with tracer.span('network', url=url, chars=len(data)):
+            text = transport(url, headers, data, (connectTimeout, readTimeout)).text
+        with tracer.span('deserialize'):
+            return deserialize(text)
     except Exception as e:
         return e
 
-def parallelMap(pool, fn, *iterables, timeout=None):
+def inputSize(inputObj) -> int:
+    """
+    @param inputObj: API input, e.g. S2ApiInput or a JSON-serializable object
+    @return: approximate size of the input in characters
+    """
+    if isinstance(inputObj, str):
+        return len(inputObj)
+    if isinstance(inputObj, tuple):
+        return sum(len(v) for v in inputObj if isinstance(v, str))
+    return len(json.dumps(inputObj))
+
+def parallelMap(pool, fn, *iterables, timeout=None, window=None, maxBytes=None, sizeFunc=None, monitor=None):
     """
     Lazy map given funcion on given data using a thread/process pool.
     @param pool: thread or process pool with submit() function
@@ -120,40 +300,198 @@ def parallelMap(pool, fn, *iterables, timeout=None):
     @param iterables: iterables of individual arguments
     @param timeout: The maximum number of seconds to wait. If None, then there
             is no limit on the wait time.
+    @param window: maximal number of submitted items whose results were not yet returned,
+            typically twice the number of the pool's workers, which is the default; 2 * CPU count
+            for pools which do not tell the number of their workers
+    @param maxBytes: maximal total size of submitted items whose results were not yet returned;
+            if reached, no more items are submitted until some results are returned.
+            The size of the item's arguments is used as a proxy for the size of its result.
+    @param sizeFunc: function (*args) -> size of the item in bytes, required with maxBytes
+    @param monitor: monitor.PipelineMonitor reporting the progress and limiting the memory, or None
+
+    If tracing is enabled (see trace.activate()) and the pool is a thread pool, the time each item waits
+    in the pool is recorded as a 'queue' span and fn runs in the trace context of its first argument.
 
     NOTE: We override Executor.map because the original code was not memory efficient since
     it stored all Future objects in a list. This implementation is using a queue.
     """
     if timeout is not None:
         end_time = timeout + time.time()
+    if window is None:
+        window = 2 * getattr(pool, '_max_workers', os.cpu_count() or 1)
+
+    from concurrent.futures import ThreadPoolExecutor
 
     argStream = zip(*iterables)
+    # the spans of other processes would not reach the tracer
+    tracer = trace.getTracer() if isinstance(pool, ThreadPoolExecutor) else trace.NULL_TRACER
+    # queue of tuples (future, item size)
+    buffer = deque()
+    inFlightBytes = 0
+
+    def overBudget():
+        return ((maxBytes is not None and inFlightBytes >= maxBytes)
+                or (monitor is not None and monitor.overMemory()))
 
-    # Create a queue of size 2 * max_workers
-    buffer = deque([pool.submit(fn, *args) for args in list(islice(argStream, 2 * pool._max_workers))])
+    def submit():
+        nonlocal inFlightBytes
+        while len(buffer) < window:
+            # at least one item is always in flight, so that the processing cannot get stuck
+            if buffer and overBudget():
+                if monitor is not None:
+                    monitor.throttled(inFlightBytes)
+                return
+            try:
+                args = next(argStream)
+            except StopIteration:
+                return
+            size = sizeFunc(*args) if sizeFunc is not None else 0
+            inFlightBytes += size
+            if tracer.enabled:
+                future = pool.submit(_tracedCall, tracer, tracer.now(), fn, *args)
+            else:
+                future = pool.submit(fn, *args)
+            buffer.append((future, size))
+
+    # Fill the queue up to the window
+    submit()
 
     # Yield must be hidden in closure so that the futures are submitted
     # before the first iterator value is required.
     def result_iterator():
+        nonlocal inFlightBytes
         try:
             # In a loop, pop a result from the queue and submit new data to be processed
             while buffer:
-                future = buffer.popleft()
+                future, size = buffer[0]
                 if timeout is None:
-                    yield future.result()
+                    result = future.result()
                 else:
-                    yield future.result(end_time - time.time())
-                try:
-                    args = next(argStream)
-                    buffer.append(pool.submit(fn, *args))
-                except StopIteration:
-                    pass
+                    result = future.result(end_time - time.time())
+                buffer.popleft()
+                inFlightBytes -= size
+                if monitor is not None:
+                    monitor.itemDone(size, inFlightBytes)
+                submit()
+                yield result
         finally:
-            for future in buffer:
+            for future, _ in buffer:
                 future.cancel()
     return result_iterator()
 
-def remoteCalls(inputData, threadCount=1, returnInputs=False, failFast=True, **callArgs):
+def _tracedCall(tracer, submitTime, fn, *args):
+    traceId = tracer.traceIdOf(args[0]) if args else None
+    tracer.add('queue', submitTime, traceId=traceId)
+    try:
+        with tracer.context(traceId):
+            return fn(*args)
+    finally:
+        if args:
+            tracer.unbind(args[0])
+
+class DeadlineExceeded(Exception):
+    """
+    Returned as the result of an item whose deadline passed before it could be processed.
+    """
+
+LatencyStats = namedtuple('LatencyStats', ['count', 'expired', 'totalLatency', 'maxLatency'])
+"""
+Latency statistics of a group of items: number of processed and expired items, total and maximal
+time in seconds from reading an item from the input to returning its result.
+"""
+
+class SchedulerStats:
+    """
+    Latency statistics of items processed by priorityMap(), per priority.
+    """
+
+    def __init__(self):
+        self.byPriority = {}
+
+    def record(self, priority, latency, expired=False):
+        count, expiredCount, totalLatency, maxLatency = self.byPriority.get(priority, LatencyStats(0, 0, 0.0, 0.0))
+        self.byPriority[priority] = LatencyStats(
+                count + 1, expiredCount + int(expired), totalLatency + latency, max(maxLatency, latency))
+
+    def meanLatency(self, priority) -> float:
+        stats = self.byPriority[priority]
+        return stats.totalLatency / stats.count
+
+def priorityMap(pool, fn, items, priority=None, deadline=None, maxInFlight=1, prefetch=None, stats=None):
+    """
+    Lazy map given function on given data using a thread/process pool, processing urgent items first.
+    Up to `prefetch` items are read ahead from the input and the most urgent ones are submitted to the pool,
+    keeping at most `maxInFlight` of them submitted at a time. An item is more urgent if it has a lower priority
+    value; items with the same priority are ordered by their deadlines, then by their input order.
+    Items whose deadline passed before they were submitted are not processed at all, DeadlineExceeded
+    is returned as their result.
+
+    @param pool: thread or process pool with submit() function
+    @param fn: function of a single argument to map
+    @param items: iterable of arguments
+    @param priority: function item -> priority (a number), by default all items have priority 0
+    @param deadline: function item -> deadline as a time.time() value or None
+    @param maxInFlight: maximal number of items submitted to the pool at a time,
+        typically the number of the pool's workers
+    @param prefetch: maximal number of items read ahead, 2 * maxInFlight by default
+    @param stats: SchedulerStats collecting the latencies or None
+    @return: generator of tuples (item, result) in the order of completion
+    """
+    import heapq
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    if maxInFlight < 1:
+        raise ValueError('maxInFlight has to be at least 1, got {}'.format(maxInFlight))
+    prefetch = 2 * maxInFlight if prefetch is None else prefetch
+    tracer = trace.getTracer()
+    itemIter = iter(items)
+    queue = []
+    running = {}
+    seq = itertools.count()
+    exhausted = False
+
+    try:
+        while True:
+            while not exhausted and len(queue) < prefetch:
+                try:
+                    item = next(itemIter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                prio = priority(item) if priority else 0
+                itemDeadline = deadline(item) if deadline else None
+                itemDeadline = float('inf') if itemDeadline is None else itemDeadline
+                heapq.heappush(queue, (prio, itemDeadline, next(seq), time.time(), item))
+
+            while queue and len(running) < maxInFlight:
+                prio, itemDeadline, _, readTime, item = heapq.heappop(queue)
+                now = time.time()
+                if itemDeadline < now:
+                    if stats is not None:
+                        stats.record(prio, now - readTime, expired=True)
+                    tracer.unbind(item)
+                    yield item, DeadlineExceeded('deadline passed {:.3f}s ago'.format(now - itemDeadline))
+                else:
+                    running[pool.submit(fn, item)] = (prio, readTime, item)
+
+            if not running:
+                if exhausted and not queue:
+                    break
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                prio, readTime, item = running.pop(future)
+                if stats is not None:
+                    stats.record(prio, time.time() - readTime)
+                tracer.unbind(item)
+                yield item, future.result()
+    finally:
+        for future in running:
+            future.cancel()
+
+def remoteCalls(inputData, threadCount=1, returnInputs=False, failFast=True, client=None,
+        maxInFlightBytes=None, monitor=None, **callArgs):
     """
     Call REST API in parallel with given data and arguments
 
@@ -162,17 +500,104 @@ def remoteCalls(inputData, threadCount=1, returnInputs=False, failFast=True, **c
     @param returnInputs: if true, tuples (input, output) will be generated
     @param failFast: if true, raise an exception at any failure. If false and a remote call fails,
         return the exception as its return value.
+    @param client: optional long-lived ResidentClient (see geneeasdk.util.client) used for the calls
+        instead of a new thread pool; threadCount is ignored in that case
+    @param maxInFlightBytes: maximal total size of inputs (see inputSize()) whose results were not yet returned,
+        see parallelMap(); not used with a client
+    @param monitor: monitor.PipelineMonitor, see parallelMap(); not used with a client
     @param callArgs: arguments delegated to remoteCall()
 
     @return: generator of API call results or of tuples (input, output), depending
-        on returnInput parameter
+        on returnInput parameter, in the input order
     """
+    if client is not None:
+        yield from _callResults(client.map(inputData, **callArgs), returnInputs, failFast)
+        return
 
-    reqFunc = lambda d: (d, remoteCall(inputData=d, **callArgs))
-    retValFunc = (lambda x: x) if returnInputs else itemgetter(1)
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=threadCount) as executor:
+        reqFunc = lambda d: (d, remoteCall(inputData=d, **callArgs))
+        inputsAndResults = parallelMap(executor, reqFunc, inputData, window=2 * threadCount,
+                maxBytes=maxInFlightBytes, sizeFunc=inputSize, monitor=monitor)
+        yield from _callResults(inputsAndResults, returnInputs, failFast)
+
+def scheduledCalls(docs, flags, deserialize, priority=None, deadline=None, threadCount=1, failFast=True,
+        schedulerStats=None, prefetch=None, **callArgs):
+    """
+    Call S2 API for each document, processing urgent documents first (see priorityMap()),
+    e.g. interactive requests before a backfill.
+
+    Documents whose deadline passed before their call started are not sent to the API, DeadlineExceeded
+    is returned as their result. It is returned even if failFast is true, so that an expired document
+    does not stop the processing of the others.
+
+    @param docs: iterable of documents
+    @param flags: API call flags
+    @param deserialize: function str -> output data object, e.g. SentimentResponse.fromJsonStr
+    @param priority: function document -> priority (lower is more urgent), by default all documents have priority 0
+    @param deadline: function document -> deadline as a time.time() value or None
+    @param threadCount: number of worker threads used for parallel API calls
+    @param failFast: if true, raise an exception at any failure except DeadlineExceeded. If false and a call
+        fails, return the exception as its result.
+    @param schedulerStats: SchedulerStats collecting the latencies per priority, or None
+    @param prefetch: maximal number of documents read ahead, see priorityMap()
+    @param callArgs: arguments delegated to remoteCall(), e.g. url and key
+    @return: generator of tuples (document, result) in the order of completion
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    callArgs.setdefault('serialize', S2ApiInput.serialize)
+    tracer = trace.getTracer()
+
+    def call(doc):
+        with tracer.context(doc.uid):
+            return remoteCall(inputData=S2ApiInput.fromDocAndFlags(doc, flags), deserialize=deserialize, **callArgs)
 
     with ThreadPoolExecutor(max_workers=threadCount) as executor:
-        for (inputObj, result) in parallelMap(executor, reqFunc, inputData):
-            if isinstance(result, Exception) and failFast:
+        for doc, result in priorityMap(executor, call, docs, priority=priority, deadline=deadline,
+                maxInFlight=threadCount, prefetch=prefetch, stats=schedulerStats):
+            if failFast and isinstance(result, Exception) and not isinstance(result, DeadlineExceeded):
                 raise result
-            yield retValFunc((inputObj, result))
+            yield doc, result
+
+def mergedCalls(items, lookup, callFunc):
+    """
+    Lazily process only some of the items by callFunc, the results of the other items are looked up.
+
+    @param items: iterable of items
+    @param lookup: function item -> None if the item has to be processed by callFunc, otherwise a function
+        () -> result of the item. The returned function is called only after the results of all
+        the preceding items were generated.
+    @param callFunc: function item iterable -> iterable of their results in the same order, e.g. an API wrapper
+    @return: generator of results of all the items in the input order
+    """
+    pending = deque()
+
+    def calledItems():
+        for item in items:
+            getResult = lookup(item)
+            pending.append(getResult)
+            if getResult is None:
+                yield item
+
+    for result in callFunc(calledItems()):
+        # results of looked-up items preceding the called one
+        while pending[0] is not None:
+            yield pending.popleft()()
+        pending.popleft()
+        yield result
+
+    while pending:
+        yield pending.popleft()()
+
+def _callResults(inputsAndResults, returnInputs, failFast):
+    retValFunc = (lambda x: x) if returnInputs else itemgetter(1)
+    # inputs bound to trace IDs by s2ApiInputStream(), on all the paths (thread pool or resident client)
+    tracer = trace.getTracer()
+
+    for (inputObj, result) in inputsAndResults:
+        tracer.unbind(inputObj)
+        if isinstance(result, Exception) and failFast:
+            raise result
+        yield retValFunc((inputObj, result))
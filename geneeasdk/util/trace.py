@@ -0,0 +1,233 @@
+# coding=utf-8
+
+"""
+Tracing of the processing pipelines. Each document gets a trace ID (its uid) and the pipeline stages
+(parsing, building of the API input, queueing, the API call, output) record spans tagged with it.
+The spans are exported in the Chrome trace format (JSON array of events), which can be viewed
+e.g. in chrome://tracing or https://ui.perfetto.dev.
+
+Tracing is disabled by default: the active tracer is a NullTracer and the instrumented functions keep
+their fast paths. It is enabled for a block of code by `with trace.activate(Tracer(path)):`.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class NullTracer:
+    """
+    Tracer which records nothing.
+    """
+    enabled = False
+
+    def now(self) -> float:
+        return 0.0
+
+    def add(self, name, start, end=None, traceId=None, **args):
+        pass
+
+    def span(self, name, traceId=None, **args):
+        return _NULL_SPAN
+
+    def bind(self, obj, traceId):
+        pass
+
+    def traceIdOf(self, obj):
+        return None
+
+    def unbind(self, obj):
+        pass
+
+    def context(self, traceId):
+        return _NULL_SPAN
+
+    def currentTraceId(self):
+        return None
+
+    def consumed(self, items, name, traceIds=None):
+        return items
+
+    def close(self):
+        pass
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'traceId', 'args', 'start')
+
+    def __init__(self, tracer, name, traceId, args):
+        self.tracer = tracer
+        self.name = name
+        self.traceId = traceId
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer.now()
+        return self
+
+    def __exit__(self, *excInfo):
+        self.tracer.add(self.name, self.start, traceId=self.traceId, **self.args)
+        return False
+
+class Tracer(NullTracer):
+    """
+    Tracer writing the spans to a file as they are finished, so that the memory does not grow with the number
+    of documents. Thread safe.
+
+    The trace ID of a span is given explicitly, or it is the trace ID of the current context of the thread
+    (see context()). API inputs, which do not carry the document uid, can be bound to a trace ID by bind().
+    """
+    enabled = True
+
+    def __init__(self, path):
+        """
+        @param path: path of the trace file
+        """
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[\n')
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._namedThreads = set()
+        self._traceIds = {}
+        self._pid = os.getpid()
+        self._startTime = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+    def now(self) -> float:
+        """
+        @return: current time in microseconds since the tracer was created
+        """
+        return (time.perf_counter() - self._startTime) * 1e6
+
+    def add(self, name, start, end=None, traceId=None, **args):
+        """
+        Record a finished span.
+        @param name: name of the pipeline stage
+        @param start: start time returned by now()
+        @param end: end time, now by default
+        @param traceId: trace ID, the trace ID of the current context by default
+        @param args: additional values shown with the span
+        """
+        end = self.now() if end is None else end
+        traceId = getattr(self._local, 'traceId', None) if traceId is None else traceId
+        if traceId is not None:
+            args['traceId'] = traceId
+        thread = threading.current_thread()
+        event = {'name': name, 'ph': 'X', 'ts': start, 'dur': end - start, 'pid': self._pid, 'tid': thread.ident}
+        if args:
+            event['args'] = args
+        line = json.dumps(event, ensure_ascii=False, default=str)
+
+        with self._lock:
+            if thread.ident not in self._namedThreads:
+                self._namedThreads.add(thread.ident)
+                self._file.write(json.dumps({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': thread.ident,
+                        'args': {'name': thread.name}}) + ',\n')
+            self._file.write(line + ',\n')
+
+    def span(self, name, traceId=None, **args):
+        """
+        @return: context manager recording a span of its block
+        """
+        return _Span(self, name, traceId, args)
+
+    def bind(self, obj, traceId):
+        """
+        Bind an object (e.g. an API input) to a trace ID until unbind() is called. The tracer keeps a reference
+        to the object, so that its id() cannot be reused by another object in the meantime.
+        """
+        self._traceIds[id(obj)] = (obj, traceId)
+
+    def traceIdOf(self, obj):
+        """
+        @return: trace ID bound to the object or None
+        """
+        entry = self._traceIds.get(id(obj))
+        return entry[1] if entry is not None and entry[0] is obj else None
+
+    def unbind(self, obj):
+        entry = self._traceIds.get(id(obj))
+        if entry is not None and entry[0] is obj:
+            self._traceIds.pop(id(obj), None)
+
+    @contextmanager
+    def context(self, traceId):
+        """
+        @return: context manager setting the trace ID of the spans recorded by the current thread in its block
+        """
+        previous = getattr(self._local, 'traceId', None)
+        self._local.traceId = traceId
+        try:
+            yield
+        finally:
+            self._local.traceId = previous
+
+    def currentTraceId(self):
+        """
+        @return: trace ID of the current context of the thread or None
+        """
+        return getattr(self._local, 'traceId', None)
+
+    def consumed(self, items, name, traceIds=None):
+        """
+        Record the time the consumer of an iterable spends with each item, e.g. printing of the results.
+        @param items: iterable
+        @param name: name of the spans, they are tagged by the index of the item
+        @param traceIds: iterable of the trace IDs of the items (in the same order), or None if they are not known
+        @return: generator of the items
+        """
+        traceIds = itertools.repeat(None) if traceIds is None else traceIds
+        for index, (item, traceId) in enumerate(zip(items, traceIds)):
+            start = self.now()
+            yield item
+            self.add(name, start, traceId=traceId, index=index)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                # the closing bracket is optional in the Chrome trace format, the trailing comma is tolerated too,
+                # but a complete JSON document is friendlier to other tools
+                self._file.write(json.dumps({'name': 'end', 'ph': 'i', 's': 'g', 'ts': self.now(),
+                        'pid': self._pid, 'tid': 0}) + '\n]\n')
+                self._file.close()
+
+NULL_TRACER = NullTracer()
+
+_activeTracer = NULL_TRACER
+
+def getTracer():
+    """
+    @return: the active tracer, NULL_TRACER if tracing is disabled
+    """
+    return _activeTracer
+
+@contextmanager
+def activate(tracer):
+    """
+    @return: context manager making the tracer active in its block (in all threads)
+    """
+    global _activeTracer
+    previous = _activeTracer
+    _activeTracer = tracer
+    try:
+        yield tracer
+    finally:
+        _activeTracer = previous
@@ -4,11 +4,19 @@
 Functions for dealing with the vertical format
 """
 
+import json
+import os
 import re
 
 from collections import namedtuple
 
 from geneeasdk.util.datautil import Document
+from geneeasdk.util.restutil import REQUEST_MAX_SIZE, parallelMap
+
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# space reserved for the fields of an API request other than the text
+PACK_REQUEST_RESERVE = 4 * 1024
 
 TabularDocument = namedtuple('TabularDocument', ['docId', 'sentences'])
 """
@@ -16,15 +24,49 @@ A document with an ID and iterable of sentences. A sentence is an iterable of wo
 Number and meaning of the fields is not fixed by this class.
 """
 
-def tabularDocStream(lines, docIdRegex):
+SentencePack = namedtuple('SentencePack', ['document', 'sentenceIds', 'offsets'])
+"""
+Several sentences of one document packed into a single API input document. The text of the document
+consists of the sentences joined by a separator; `offsets` are the character offsets of the sentences
+in that text and `sentenceIds` their IDs in the {original doc ID}-{zero-based sentence ID} format.
+"""
+
+def _literalPrefix(docIdRegex):
+    """
+    @param docIdRegex: compiled regex
+    @return: literal prefix of all strings matching the regex, possibly empty
+    """
+    pattern = docIdRegex.pattern
+    # whitespace and comments in verbose patterns are not literal
+    if not isinstance(pattern, str) or docIdRegex.flags & (re.IGNORECASE | re.VERBOSE) or '|' in pattern:
+        return ''
+    prefix = []
+    for ch in pattern:
+        if ch in '.^$*+?{}[]\\|()':
+            if ch in '*?{' and prefix:
+                # the last literal character is optional or repeated
+                prefix.pop()
+            break
+        prefix.append(ch)
+    return ''.join(prefix)
+
+def _compileDocIdRegex(docIdRegex, docIdPrefix):
+    if isinstance(docIdRegex, str):
+        docIdRegex = re.compile(docIdRegex)
+    if docIdPrefix is None:
+        docIdPrefix = _literalPrefix(docIdRegex)
+    return docIdRegex, docIdPrefix
+
+def tabularDocStream(lines, docIdRegex, docIdPrefix=None):
     """
     Read documents from a vertical format. Returned documents have tabular structure corresponding to the input data.
     @param lines: iterable of lines in vertical format
     @param docIdRegex: regex capturing the document ID format
+    @param docIdPrefix: literal prefix of all document ID lines; the regex is tried only on lines starting
+        with the prefix. By default, it is derived from the regex.
     @return: generator of TabularDocument instances
     """
-    if isinstance(docIdRegex, str):
-        docIdRegex = re.compile(docIdRegex)
+    docIdRegex, docIdPrefix = _compileDocIdRegex(docIdRegex, docIdPrefix)
 
     docId = None
     sentences = []
@@ -32,7 +74,7 @@ def tabularDocStream(lines, docIdRegex):
 
     for line in lines:
         line = line.rstrip('\r\n')
-        docMatch = docIdRegex.fullmatch(line)
+        docMatch = line.startswith(docIdPrefix) and docIdRegex.fullmatch(line)
         if docMatch:
             if docId:
                 if rowBuf:
@@ -57,6 +99,10 @@ def tabularDocStream(lines, docIdRegex):
 def _sentText(tabularSentence, fieldNo=0):
     return ' '.join(row[fieldNo] for row in tabularSentence)
 
+def _toDocument(tabularDoc, fieldNo=0):
+    text = ' '.join(_sentText(sent, fieldNo=fieldNo) for sent in tabularDoc.sentences)
+    return Document(tabularDoc.docId, text, '', '', None, None, {})
+
 def docStream(lines, docIdRegex, fieldNo=0):
     """
     Read documents usable as API inputs from a vertical format. Plain text of the document is created
@@ -66,8 +112,7 @@ def docStream(lines, docIdRegex, fieldNo=0):
     @return: generator of Document instances
     """
     for tabularDoc in tabularDocStream(lines, docIdRegex):
-        text = ' '.join(_sentText(sent, fieldNo=fieldNo) for sent in tabularDoc.sentences)
-        yield Document(tabularDoc.docId, text, '', '', None, None, {})
+        yield _toDocument(tabularDoc, fieldNo=fieldNo)
 
 def sentenceDocStream(lines, docIdRegex, fieldNo=0):
     """
@@ -84,6 +129,49 @@ def sentenceDocStream(lines, docIdRegex, fieldNo=0):
             docId = '{}-{}'.format(tabularDoc.docId, i)
             yield Document(docId, text, '', '', None, None, {})
 
+def packedSentenceDocStream(lines, docIdRegex, fieldNo=0, maxSize=REQUEST_MAX_SIZE - PACK_REQUEST_RESERVE,
+        separator='\n'):
+    """
+    Read sentences from a vertical format and pack consecutive sentences of each document into API input documents
+    so that they can be processed by a single API call instead of a call per sentence (see sentenceDocStream()).
+    A pack contains sentences of a single document only and the size of its JSON-encoded text does not exceed
+    maxSize, unless it consists of a single longer sentence.
+    @param lines: iterable of lines in vertical format
+    @param docIdRegex: regex capturing the document ID format
+    @param maxSize: maximal size of a packed text in bytes, when encoded in JSON
+    @param separator: string separating the sentences in the packed text
+    @return: generator of SentencePack instances
+    """
+    sepSize = len(json.dumps(separator)) - 2
+
+    for tabularDoc in tabularDocStream(lines, docIdRegex):
+        texts, sentenceIds, offsets = [], [], []
+        offset = size = 0
+
+        for i, sent in enumerate(tabularDoc.sentences):
+            text = _sentText(sent, fieldNo=fieldNo)
+            textSize = len(json.dumps(text)) - 2
+            if texts and size + sepSize + textSize > maxSize:
+                yield _sentencePack(tabularDoc.docId, texts, sentenceIds, offsets, separator)
+                texts, sentenceIds, offsets = [], [], []
+                offset = size = 0
+            if texts:
+                offset += len(separator)
+                size += sepSize
+            texts.append(text)
+            sentenceIds.append('{}-{}'.format(tabularDoc.docId, i))
+            offsets.append(offset)
+            offset += len(text)
+            size += textSize
+
+        if texts:
+            yield _sentencePack(tabularDoc.docId, texts, sentenceIds, offsets, separator)
+
+def _sentencePack(docId, texts, sentenceIds, offsets, separator):
+    packId = '{}-{}'.format(docId, sentenceIds[0].rsplit('-', 1)[1])
+    document = Document(packId, separator.join(texts), '', '', None, None, {})
+    return SentencePack(document, tuple(sentenceIds), tuple(offsets))
+
 def sentenceTextStream(lines, docIdRegex, fieldNo=0):
     """
     Read sentences from a vertical format and for each return its plain text.
@@ -95,3 +183,83 @@ def sentenceTextStream(lines, docIdRegex, fieldNo=0):
     for tabularDoc in tabularDocStream(lines, docIdRegex):
         for sent in tabularDoc.sentences:
             yield _sentText(sent, fieldNo=fieldNo)
+
+def _chunkBounds(path, docIdRegex, docIdPrefix, chunkSize, encoding):
+    """
+    Split a file in vertical format to chunks of approximately given size. Each chunk except the first one
+    starts with a document ID line.
+    @return: list of byte offsets of the chunk starts, followed by the file size
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as f:
+        offset = chunkSize
+        while offset < size:
+            # skip the rest of the line containing the byte before the offset
+            f.seek(offset - 1)
+            f.readline()
+            while True:
+                start = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                line = line.decode(encoding).rstrip('\r\n')
+                if line.startswith(docIdPrefix) and docIdRegex.fullmatch(line):
+                    bounds.append(start)
+                    break
+            offset = f.tell() + chunkSize
+    bounds.append(size)
+    return bounds
+
+def _parseChunk(path, start, end, docIdRegex, docIdPrefix, encoding, fieldNo):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).decode(encoding).split('\n')
+    tabularDocs = tabularDocStream(lines, docIdRegex, docIdPrefix)
+    if fieldNo is None:
+        return list(tabularDocs)
+    return [_toDocument(tabularDoc, fieldNo=fieldNo) for tabularDoc in tabularDocs]
+
+def _parallelStream(path, docIdRegex, fieldNo, processCount, chunkSize, docIdPrefix, encoding):
+    from concurrent.futures import ProcessPoolExecutor
+
+    docIdRegex, docIdPrefix = _compileDocIdRegex(docIdRegex, docIdPrefix)
+    processCount = processCount or os.cpu_count() or 1
+    bounds = _chunkBounds(path, docIdRegex, docIdPrefix, chunkSize, encoding)
+    chunkCount = len(bounds) - 1
+
+    with ProcessPoolExecutor(max_workers=processCount) as pool:
+        chunks = parallelMap(pool, _parseChunk, [path] * chunkCount, bounds[:-1], bounds[1:],
+                [docIdRegex] * chunkCount, [docIdPrefix] * chunkCount, [encoding] * chunkCount,
+                [fieldNo] * chunkCount, window=2 * processCount)
+        for docs in chunks:
+            yield from docs
+
+def parallelTabularDocStream(path, docIdRegex, processCount=None, chunkSize=DEFAULT_CHUNK_SIZE,
+        docIdPrefix=None, encoding='utf-8'):
+    """
+    Read documents from a file in vertical format using a pool of processes. The file is split to chunks
+    starting at document ID lines which are parsed in parallel. The documents are returned in the original order.
+
+    The parsed documents are pickled back to the calling process, which costs more than the parsing itself
+    for these deeply nested tuples: with a single process, this is several times slower than tabularDocStream.
+    It pays off only with several cores (see benchmarks/vertical_throughput.py); parallelDocStream,
+    which returns flat documents, has a much smaller overhead.
+    @param path: path of the file in vertical format
+    @param docIdRegex: regex capturing the document ID format
+    @param processCount: number of worker processes, CPU count by default
+    @param chunkSize: approximate size of a chunk in bytes
+    @param docIdPrefix: literal prefix of all document ID lines, see tabularDocStream()
+    @param encoding: encoding of the file
+    @return: generator of TabularDocument instances
+    """
+    return _parallelStream(path, docIdRegex, None, processCount, chunkSize, docIdPrefix, encoding)
+
+def parallelDocStream(path, docIdRegex, fieldNo=0, processCount=None, chunkSize=DEFAULT_CHUNK_SIZE,
+        docIdPrefix=None, encoding='utf-8'):
+    """
+    Read documents usable as API inputs from a file in vertical format using a pool of processes,
+    see parallelTabularDocStream() and docStream().
+    @return: generator of Document instances
+    """
+    return _parallelStream(path, docIdRegex, fieldNo, processCount, chunkSize, docIdPrefix, encoding)
@@ -38,7 +38,12 @@ setup(
     # setup will create executable scripts based on this list
     entry_points={
         'console_scripts': [
-
+            'geneea-diacritization = geneeasdk.diacritization:main',
+            'geneea-entities = geneeasdk.entities:main',
+            'geneea-language = geneeasdk.language:main',
+            'geneea-sentiment = geneeasdk.sentiment:main',
+            'geneea-tags = geneeasdk.tags:main',
+            'geneea-topic = geneeasdk.topic:main',
         ],
     },
 
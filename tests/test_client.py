@@ -0,0 +1,80 @@
+# coding=utf-8
+
+import threading
+import unittest
+
+from geneeasdk.util.client import ResidentClient
+from geneeasdk.util.restutil import TransportResponse
+
+def echoTransport(url, headers, data, timeout):
+    return TransportResponse(200, data)
+
+class BlockingTransport:
+    """
+    Echo transport counting the calls and blocking them until released
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, url, headers, data, timeout):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(3)
+        return TransportResponse(200, data)
+
+class ResidentClientTest(unittest.TestCase):
+
+    def testCall(self):
+        with ResidentClient(threadCount=2) as client:
+            futures = [client.submit({'n': i}, url='u', transport=echoTransport) for i in range(10)]
+            self.assertEqual([{'n': i} for i in range(10)], [f.result(timeout=3) for f in futures])
+
+    def testInvalidCallArgumentsFailTheFuture(self):
+        with ResidentClient() as client:
+            future = client.submit('x', url='u', transport=echoTransport, unknownArg=1)
+            with self.assertRaises(TypeError):
+                future.result(timeout=3)
+
+    def testSessionRejected(self):
+        with ResidentClient() as client:
+            with self.assertRaises(ValueError):
+                client.submit('x', url='u', transport=echoTransport, session=None)
+
+    def testIdenticalRequestsShareCallWhileBusy(self):
+        transport = BlockingTransport()
+        with ResidentClient(threadCount=1) as client:
+            first = client.submit('first', url='u', transport=transport)
+            transport.started.wait(3)
+            # the only worker is busy, so the following requests wait and are dispatched as one batch
+            futures = [client.submit('same', url='u', transport=transport) for _ in range(5)]
+            transport.release.set()
+            self.assertEqual('first', first.result(timeout=3))
+            self.assertEqual(['same'] * 5, [f.result(timeout=3) for f in futures])
+        self.assertEqual(2, transport.calls)
+
+    def testSubmitDuringClose(self):
+        for _ in range(20):
+            client = ResidentClient(threadCount=2)
+            futures = []
+
+            def submit():
+                try:
+                    futures.append(client.submit('x', url='u', transport=echoTransport))
+                except RuntimeError:
+                    # submitted after close
+                    pass
+
+            threads = [threading.Thread(target=submit) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            client.close()
+            for thread in threads:
+                thread.join()
+            # every accepted request is processed
+            self.assertEqual(['x'] * len(futures), [f.result(timeout=3) for f in futures])
+
+if __name__ == '__main__':
+    unittest.main()
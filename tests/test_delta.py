@@ -0,0 +1,82 @@
+# coding=utf-8
+
+import json
+import os
+import tempfile
+import unittest
+
+from geneeasdk.sentiment import SentimentResponse, getSentiment
+from geneeasdk.util import delta
+from geneeasdk.util.datautil import Document
+from geneeasdk.util.restutil import TransportResponse
+
+class CountingTransport:
+    """
+    Sentiment transport counting the calls per text; texts starting with 'fail' get a server error
+    """
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, url, headers, data, timeout):
+        text = json.loads(data)['text']
+        self.texts.append(text)
+        if text.startswith('fail'):
+            return TransportResponse(500, 'error')
+        return TransportResponse(200, json.dumps({'sentiment': len(text), 'label': 'positive', 'language': 'en'}))
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpDir.cleanup)
+        self.path = os.path.join(tmpDir.name, 'delta.db')
+        self.transport = CountingTransport()
+
+    def process(self, texts, prune=False):
+        docs = [Document.make(str(i), text) for i, text in enumerate(texts)]
+        with delta.FingerprintStore(self.path) as store:
+            apiFunc = delta.incremental(getSentiment, store, SentimentResponse, prune=prune)
+            return list(apiFunc(docs, {}, url='u', transport=self.transport, failFast=False))
+
+    def testUnchangedRerunMakesNoCalls(self):
+        first = self.process(['a', 'bb', 'ccc'])
+        self.transport.texts.clear()
+        second = self.process(['a', 'bb', 'ccc'])
+        self.assertEqual([], self.transport.texts)
+        self.assertEqual(first, second)
+        self.assertEqual([SentimentResponse(1, 'positive', 'en')], second[:1])
+
+    def testChangedRowMakesOneCall(self):
+        self.process(['a', 'bb', 'ccc'])
+        self.transport.texts.clear()
+        results = self.process(['a', 'changed', 'ccc'])
+        self.assertEqual(['changed'], self.transport.texts)
+        self.assertEqual([1, 7, 3], [result.sentiment for result in results])
+
+    def testFailedCallIsNotStored(self):
+        results = self.process(['a', 'fail'])
+        self.assertIsInstance(results[1], Exception)
+        with delta.FingerprintStore(self.path) as store:
+            self.assertIsNone(store.get('1'))
+        self.transport.texts.clear()
+        self.process(['a', 'fail'])
+        self.assertEqual(['fail'], self.transport.texts)
+
+    def testStoredResultsAreJson(self):
+        self.process(['a'])
+        with delta.FingerprintStore(self.path) as store:
+            _, kind, result = store.get('0')
+        self.assertEqual('SentimentResponse', kind)
+        self.assertEqual({'sentiment': 1, 'label': 'positive', 'language': 'en'}, result)
+
+    def testPrune(self):
+        self.process(['a', 'bb', 'ccc'])
+        self.process(['a', 'bb'], prune=True)
+        with delta.FingerprintStore(self.path) as store:
+            self.assertIsNotNone(store.get('0'))
+            self.assertIsNotNone(store.get('1'))
+            self.assertIsNone(store.get('2'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# coding=utf-8
+
+import json
+import re
+import unittest
+
+from geneeasdk.entities import getEntities, getSentenceEntities
+from geneeasdk.util import vertical
+from geneeasdk.util.restutil import TransportResponse
+
+def entitiesTransport(url, headers, data, timeout):
+    """
+    Fake entities API: capitalized words are entities, an entity for each distinct word
+    """
+    instances = {}
+    for match in re.finditer(r'\b[A-Z]\w*', json.loads(data)['text']):
+        instances.setdefault(match.group(), []).append(
+                {'text': match.group(), 'textOffset': match.start(), 'textSegment': 'text'})
+    entities = [{'name': name, 'type': 'thing', 'instances': i, 'links': {}} for name, i in instances.items()]
+    return TransportResponse(200, json.dumps({'entities': entities, 'language': 'en'}))
+
+def _instances(response):
+    """
+    @return: sorted entity instances of the response; the order of entities is not significant
+    """
+    return sorted((e.name, e.type, i.text, i.textOffset) for e in response.entities for i in e.instances)
+
+def verticalLines():
+    sentences = ['Prague is in Bohemia', 'the river flows', 'Anna met Prague friends in Prague', 'it rains']
+    for docNo in range(5):
+        yield 'doc{}'.format(docNo)
+        for sentNo, sentence in enumerate(sentences[docNo % 2:]):
+            yield from ('{}\t{}'.format(word, sentNo) for word in sentence.split())
+            yield ''
+
+class SentenceEntitiesTest(unittest.TestCase):
+
+    def _perSentence(self, **kwargs):
+        docs = list(vertical.sentenceDocStream(verticalLines(), r'doc\d+'))
+        results = getEntities(docs, {}, url='u', transport=entitiesTransport, **kwargs)
+        return {doc.uid: _instances(result) for doc, result in zip(docs, results)}
+
+    def testPackedMatchesPerSentence(self):
+        for maxSize in (30, 60, 1000):
+            with self.subTest(maxSize=maxSize):
+                packs = vertical.packedSentenceDocStream(verticalLines(), r'doc\d+', maxSize=maxSize)
+                packed = {sentenceId: _instances(result) for sentenceId, result
+                          in getSentenceEntities(packs, {}, url='u', transport=entitiesTransport)}
+                self.assertEqual(self._perSentence(), packed)
+
+    def testReturnInputs(self):
+        packs = vertical.packedSentenceDocStream(verticalLines(), r'doc\d+')
+        packed = {sentenceId: _instances(result) for sentenceId, result
+                  in getSentenceEntities(packs, {}, url='u', transport=entitiesTransport, returnInputs=True)}
+        self.assertEqual(self._perSentence(), packed)
+
+if __name__ == '__main__':
+    unittest.main()
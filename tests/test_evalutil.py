@@ -0,0 +1,112 @@
+# coding=utf-8
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from geneeasdk.util import evalutil
+from geneeasdk.util.evalutil import ClassificationEval, MatchEval, RegressionEval
+
+def classification():
+    evaluation = ClassificationEval()
+    for trueLabel, predictedLabel in [('a', 'a'), ('a', 'b'), ('b', 'b'), ('c', 'a')]:
+        evaluation.add(trueLabel, predictedLabel)
+    return evaluation
+
+def regression():
+    evaluation = RegressionEval()
+    for trueValue, predictedValue in [(1, 2), (2, 2), (3, 4)]:
+        evaluation.add(trueValue, predictedValue)
+    return evaluation
+
+def match():
+    evaluation = MatchEval()
+    evaluation.add(['x', 'y'], ['x', 'z'])
+    evaluation.add(['x'], [])
+    return evaluation
+
+EXPECTED = [
+    (classification, {'accuracy': 0.5, 'macroF1': (0.5 + 2 / 3 + 0.0) / 3}),
+    (regression, {'mae': 2 / 3, 'pearson': 2 / (48 / 9) ** 0.5}),
+    (match, {'precision': 1 / 2, 'recall': 1 / 3, 'f1': 0.4}),
+]
+
+class EvaluationTest(unittest.TestCase):
+
+    def assertMetrics(self, evaluation, expected):
+        for name, value in expected.items():
+            with self.subTest(kind=evaluation.kind, metric=name):
+                self.assertAlmostEqual(value, evaluation.metric(name))
+
+    def testKnownValues(self):
+        for create, expected in EXPECTED:
+            self.assertMetrics(create(), expected)
+
+    @unittest.skipIf(evalutil.np is None, 'NumPy is not installed')
+    def testPurePythonParity(self):
+        with mock.patch.object(evalutil, 'np', None):
+            for create, expected in EXPECTED:
+                evaluation = create()
+                self.assertIsInstance(evaluation.columns()[0], list)
+                self.assertMetrics(evaluation, expected)
+            pureStats = classification().classStats()
+        self.assertEqual(classification().classStats(), pureStats)
+
+    def testClassStats(self):
+        stats = classification().classStats()
+        self.assertEqual(evalutil.ClassStats(0.5, 0.5, 0.5, 2), stats['a'])
+        self.assertEqual(0.0, stats['c'].f1)
+        self.assertEqual(1, stats['c'].support)
+
+    def testEmptyEvaluation(self):
+        for evaluation in [ClassificationEval(), RegressionEval(), MatchEval()]:
+            for name in evaluation.metrics:
+                self.assertEqual(0.0, evaluation.metric(name))
+
+    def testUnknownMetric(self):
+        with self.assertRaises(ValueError):
+            regression().metric('accuracy')
+
+    def testMergeRemapsLabels(self):
+        first = ClassificationEval()
+        first.add('a', 'b')
+        second = ClassificationEval()
+        second.add('c', 'a')
+        second.add('b', 'b')
+
+        merged = first.merge(second)
+        self.assertEqual(['a', 'b', 'c'], merged.labels)
+        self.assertEqual([[0, 2, 1], [1, 0, 1]], [list(col) for col in merged.columns()])
+        self.assertEqual({'a': 1, 'b': 1, 'c': 1}, {label: s.support for label, s in merged.classStats().items()})
+        self.assertAlmostEqual(1 / 3, merged.metric('accuracy'))
+
+    def testMergeOfDifferentKindsFails(self):
+        with self.assertRaises(TypeError):
+            regression().merge(match())
+
+    def testStateRoundTrip(self):
+        for create, expected in EXPECTED:
+            evaluation = create()
+            restored = evalutil.fromState(evaluation.state())
+            self.assertIs(type(evaluation), type(restored))
+            self.assertEqual(evaluation.state(), restored.state())
+            self.assertMetrics(restored, expected)
+
+    def testSaveAndLoad(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'eval.json')
+            classification().save(path)
+            restored = evalutil.load(path)
+        self.assertEqual(['a', 'b', 'c'], restored.labels)
+        self.assertMetrics(restored, EXPECTED[0][1])
+
+    def testBootstrapIntervalContainsMetric(self):
+        evaluation = regression()
+        low, high = evaluation.bootstrap('mae', samples=200, seed=1)
+        self.assertLessEqual(low, evaluation.metric('mae'))
+        self.assertGreaterEqual(high, evaluation.metric('mae'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# coding=utf-8
+
+"""
+Guards against regressions of the import time of the wrapper modules and the CLIs
+"""
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIGHT_MODULES = (
+    'geneeasdk.diacritization',
+    'geneeasdk.entities',
+    'geneeasdk.language',
+    'geneeasdk.sentiment',
+    'geneeasdk.tags',
+    'geneeasdk.topic',
+    'geneeasdk.s2cli',
+    'geneeasdk.util.datautil',
+    'geneeasdk.util.restutil',
+    'geneeasdk.util.vertical',
+)
+
+# imported only by the functions which need them
+HEAVY_MODULES = (
+    'concurrent.futures',
+    'logging',
+    'numpy',
+    'requests',
+    'sqlite3',
+    'urllib3',
+    'yaml',
+)
+
+# generous ceiling of the cumulative import time of a module (without the interpreter start) in microseconds
+MAX_IMPORT_TIME = 100000
+
+def _importInFreshInterpreter(module):
+    """
+    @return: tuple (list of loaded modules, cumulative import time of the module in microseconds)
+    """
+    code = 'import sys, {m}; print(json.dumps(sorted(sys.modules)))'.format(m=module)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import json; ' + code],
+            cwd=ROOT_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    importTime = 0
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            importTime = int(parts[1])
+    return json.loads(proc.stdout), importTime
+
+class ImportTest(unittest.TestCase):
+
+    def testHeavyModulesNotImported(self):
+        for module in LIGHT_MODULES:
+            with self.subTest(module=module):
+                loaded, _ = _importInFreshInterpreter(module)
+                self.assertEqual([], [m for m in HEAVY_MODULES if m in loaded])
+
+    def testImportTime(self):
+        for module in LIGHT_MODULES:
+            with self.subTest(module=module):
+                _, importTime = _importInFreshInterpreter(module)
+                self.assertLess(importTime, MAX_IMPORT_TIME)
+
+if __name__ == '__main__':
+    unittest.main()
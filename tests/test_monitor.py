@@ -0,0 +1,38 @@
+# coding=utf-8
+
+import io
+import unittest
+
+from unittest import mock
+
+from geneeasdk.util import monitor
+from geneeasdk.util.monitor import PipelineMonitor
+
+class PipelineMonitorTest(unittest.TestCase):
+
+    def testRssCeiling(self):
+        with mock.patch.object(monitor, 'currentRss', return_value=2000):
+            self.assertTrue(PipelineMonitor(maxRss=1000).overMemory())
+            self.assertFalse(PipelineMonitor(maxRss=3000).overMemory())
+            self.assertFalse(PipelineMonitor().overMemory())
+
+    def testCeilingDisabledWithoutCurrentRss(self):
+        with mock.patch.object(monitor, 'currentRss', return_value=None), \
+                mock.patch.object(monitor, 'peakRss', return_value=2000):
+            with self.assertLogs(monitor.logger, 'WARNING'):
+                pipelineMonitor = PipelineMonitor(maxRss=1000)
+            self.assertIsNone(pipelineMonitor.maxRss)
+            self.assertFalse(pipelineMonitor.overMemory())
+
+    def testReport(self):
+        output = io.StringIO()
+        pipelineMonitor = PipelineMonitor(reportInterval=0, output=output)
+        pipelineMonitor.itemDone(10, 20)
+        pipelineMonitor.itemDone(10, 10)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertIn('2 items', lines[1])
+        self.assertIn('10 B in flight', lines[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+# coding=utf-8
+
+import json
+import unittest
+
+from geneeasdk.sentiment import getSentiment
+from geneeasdk.util import preprocess
+from geneeasdk.util.datautil import Document
+from geneeasdk.util.restutil import TransportResponse
+
+def lengthTransport(url, headers, data, timeout):
+    text = json.loads(data)['text']
+    return TransportResponse(200, json.dumps({'sentiment': len(text), 'label': text, 'language': 'en'}))
+
+class PreprocessedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.docs = [Document.make('1', 'aaa'), Document.make('2', '<b> </b>'), Document.make('3', 'c  <i>cc</i>')]
+        preprocessor = preprocess.Preprocessor(stripHtml=True, collapseWhitespace=True, dropEmpty=True)
+        self.apiFunc = preprocess.preprocessed(getSentiment, preprocessor)
+
+    def testDroppedDocumentsKeepTheirSlots(self):
+        results = list(self.apiFunc(self.docs, {}, url='u', transport=lengthTransport))
+        self.assertEqual(3, len(results))
+        self.assertEqual('aaa', results[0].label)
+        self.assertIsInstance(results[1], preprocess.EmptyDocument)
+        self.assertEqual('c cc', results[2].label)
+
+    def testReturnInputs(self):
+        results = list(self.apiFunc(self.docs, {}, url='u', transport=lengthTransport, returnInputs=True))
+        self.assertEqual(['aaa', '<b> </b>', 'c cc'], [apiInput.text for apiInput, _ in results])
+        self.assertIsInstance(results[1][1], preprocess.EmptyDocument)
+
+if __name__ == '__main__':
+    unittest.main()
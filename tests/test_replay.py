@@ -0,0 +1,84 @@
+# coding=utf-8
+
+import gzip
+import os
+import tempfile
+import unittest
+
+from types import SimpleNamespace
+
+from geneeasdk.util import replay
+from geneeasdk.util.replay import RecordingTransport, ReplayedError, ReplayTransport
+from geneeasdk.util.restutil import TransportResponse
+
+def upperTransport(url, headers, data, timeout):
+    return TransportResponse(200, data.upper())
+
+def failingTransport(url, headers, data, timeout):
+    error = IOError('service unavailable')
+    # like requests.HTTPError raised by HttpTransport
+    error.response = SimpleNamespace(status_code=503)
+    raise error
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpDir.cleanup)
+        self.tmpDir = tmpDir.name
+
+    def record(self, name, transport, inputs):
+        path = os.path.join(self.tmpDir, name)
+        with RecordingTransport(path, transport=transport) as recording:
+            for data in inputs:
+                try:
+                    recording('u', {'X-Customer-ID': 'secret'}, data, 1)
+                except IOError:
+                    pass
+        return path
+
+    def testRoundTrip(self):
+        for name in ['calls.jsonl', 'calls.jsonl.gz']:
+            with self.subTest(name=name):
+                path = self.record(name, upperTransport, ['a', 'b', 'a'])
+                records = list(replay.readLog(path))
+                self.assertEqual(['A', 'B', 'A'], [record.response for record in records])
+                self.assertEqual([200] * 3, [record.status for record in records])
+
+                sleeps = []
+                replayed = ReplayTransport(path, speed=2.0, sleep=sleeps.append)
+                self.assertEqual(3, len(replayed))
+                self.assertEqual(TransportResponse(200, 'B'), replayed('u', {}, 'b', 1))
+                self.assertEqual(TransportResponse(200, 'A'), replayed('u', {}, 'a', 1))
+                self.assertEqual([records[1].latency / 2, records[0].latency / 2], sleeps)
+
+    def testKeysNotRecorded(self):
+        path = self.record('calls.jsonl', upperTransport, ['a'])
+        with open(path, encoding='utf-8') as log:
+            self.assertNotIn('secret', log.read())
+
+    def testLogCompressedAfterClose(self):
+        path = self.record('calls.jsonl.gz', upperTransport, ['text {}'.format(i) for i in range(1000)])
+        with gzip.open(path, 'rt', encoding='utf-8') as log:
+            self.assertEqual(1000, sum(1 for _ in log))
+        # the records are compressed together, not flushed (and compressed) one by one
+        self.assertLess(os.path.getsize(path), 15 * 1000)
+
+    def testReplayedFailure(self):
+        path = self.record('calls.jsonl', failingTransport, ['a'])
+        replayed = ReplayTransport(path, speed=None)
+        with self.assertRaises(ReplayedError) as context:
+            replayed('u', {}, 'a', 1)
+        self.assertEqual(503, context.exception.status)
+        self.assertIn('service unavailable', str(context.exception))
+
+    def testMissingRecord(self):
+        path = self.record('calls.jsonl', upperTransport, ['a'])
+        replayed = ReplayTransport(path, speed=None)
+        with self.assertRaises(LookupError):
+            replayed('u', {}, 'b', 1)
+        with self.assertRaises(LookupError):
+            replayed('other', {}, 'a', 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# coding=utf-8
+
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from geneeasdk.sentiment import SentimentResponse
+from geneeasdk.util.datautil import Document
+from geneeasdk.util.monitor import PipelineMonitor
+from geneeasdk.util.restutil import (DeadlineExceeded, RateLimit, RateLimiter, RateLimitExceeded, TransportResponse,
+        parallelMap, priorityMap, scheduledCalls)
+
+def sentimentTransport(url, headers, data, timeout):
+    text = json.loads(data)['text']
+    return TransportResponse(200, json.dumps({'sentiment': len(text), 'label': 'positive', 'language': 'en'}))
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sleeps = []
+        self.limiter = RateLimiter(charLimit=RateLimit(100, 24 * 60 * 60), sleep=self.sleeps.append)
+
+    def testCallWithinBudget(self):
+        self.assertEqual(0.0, self.limiter.acquire('key', 'url', 100))
+        self.assertEqual([], self.sleeps)
+
+    def testCallExceedingBudget(self):
+        with self.assertRaises(RateLimitExceeded):
+            self.limiter.acquire('key', 'url', 500)
+        self.assertEqual([], self.sleeps)
+        self.assertEqual(0, self.limiter.stats.calls)
+
+    def testCallsOverRateWait(self):
+        limiter = RateLimiter(callLimit=RateLimit(2, 1), sleep=self.sleeps.append)
+        waits = [limiter.acquire('key', 'url') for _ in range(4)]
+        # a burst of 2 calls is allowed, then each call waits for half a second more than the previous one
+        self.assertEqual(0.0, waits[0])
+        self.assertEqual(0.0, waits[1])
+        self.assertAlmostEqual(0.5, waits[2], delta=0.05)
+        self.assertAlmostEqual(1.0, waits[3], delta=0.05)
+        self.assertEqual(waits[2:], self.sleeps)
+        self.assertAlmostEqual(1.5, limiter.stats.waitTime, delta=0.1)
+
+    def testBudgetsPerKey(self):
+        limiter = RateLimiter(callLimit=RateLimit(1, 1), sleep=self.sleeps.append)
+        self.assertEqual(0.0, limiter.acquire('key1', 'url'))
+        self.assertEqual(0.0, limiter.acquire('key2', 'url'))
+        self.assertGreater(limiter.acquire('key1', 'url'), 0.0)
+
+    def testSharedStateFile(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            stateFile = os.path.join(tmpDir, 'rates.json')
+            # two limiters, e.g. in two processes, share the budget through the file
+            limiters = [RateLimiter(callLimit=RateLimit(2, 1), stateFile=stateFile, sleep=self.sleeps.append)
+                        for _ in range(2)]
+            waits = [limiters[i % 2].acquire('secret', 'url') for i in range(3)]
+            self.assertEqual([0.0, 0.0], waits[:2])
+            self.assertAlmostEqual(0.5, waits[2], delta=0.05)
+            with open(stateFile, encoding='utf-8') as f:
+                self.assertNotIn('secret', f.read())
+
+    def testSharedStateFileWithoutLimits(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            limiter = RateLimiter(stateFile=os.path.join(tmpDir, 'rates.json'), sleep=self.sleeps.append)
+            self.assertEqual([0.0, 0.0], [limiter.acquire('key', 'url', 10) for _ in range(2)])
+
+class ScheduledCallsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.docs = [Document.make(str(i), 'x' * i, metadata={'interactive': i % 2}) for i in range(1, 7)]
+
+    def testResultsCarryDocuments(self):
+        results = list(scheduledCalls(self.docs, {}, SentimentResponse.fromJsonStr, threadCount=2, url='u',
+                transport=sentimentTransport))
+        self.assertEqual(sorted(self.docs), sorted(doc for doc, _ in results))
+        for doc, result in results:
+            self.assertEqual(len(doc.text), result.sentiment)
+
+    def testUrgentDocumentsFirst(self):
+        results = list(scheduledCalls(self.docs, {}, SentimentResponse.fromJsonStr, threadCount=1,
+                prefetch=len(self.docs), priority=lambda doc: -doc.metadata['interactive'], url='u',
+                transport=sentimentTransport))
+        self.assertEqual(['1', '3', '5', '2', '4', '6'], [doc.uid for doc, _ in results])
+
+    def testExpiredDocumentsDoNotFailFast(self):
+        results = list(scheduledCalls(self.docs, {}, SentimentResponse.fromJsonStr,
+                deadline=lambda doc: time.time() - 1, url='u', transport=sentimentTransport))
+        self.assertEqual(len(self.docs), len(results))
+        self.assertTrue(all(isinstance(result, DeadlineExceeded) for _, result in results))
+
+    def testNoPoolPerDocument(self):
+        before = threading.active_count()
+        threadCounts = []
+
+        def countingTransport(*args):
+            threadCounts.append(threading.active_count())
+            return sentimentTransport(*args)
+
+        list(scheduledCalls(self.docs, {}, SentimentResponse.fromJsonStr, threadCount=2, url='u',
+                transport=countingTransport))
+        self.assertLessEqual(max(threadCounts), before + 2)
+
+class RecordingPool:
+    """
+    Pool recording the submitted items without running them
+    """
+
+    def __init__(self, workers):
+        self._max_workers = workers
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        self.submitted.append(args)
+        return Future()
+
+class ParallelMapTest(unittest.TestCase):
+
+    def testDefaultWindowFollowsPoolSize(self):
+        pool = RecordingPool(32)
+        parallelMap(pool, str, range(1000))
+        self.assertEqual(64, len(pool.submitted))
+
+    def testMemoryBudgetKeepsOrder(self):
+        inFlight, maxInFlight = 0, 0
+        lock = threading.Lock()
+
+        def square(x):
+            nonlocal inFlight, maxInFlight
+            with lock:
+                inFlight += 1
+                maxInFlight = max(maxInFlight, inFlight)
+            time.sleep(0.001)
+            with lock:
+                inFlight -= 1
+            return x * x
+
+        with ThreadPoolExecutor(4) as pool:
+            # each item has 10 bytes, so at most 3 of them fit into the budget
+            results = list(parallelMap(pool, square, range(100), maxBytes=30, sizeFunc=lambda x: 10))
+        self.assertEqual([x * x for x in range(100)], results)
+        self.assertLessEqual(maxInFlight, 3)
+
+    def testMonitorOverMemoryKeepsOneItemInFlight(self):
+        output = io.StringIO()
+        pipelineMonitor = PipelineMonitor(reportInterval=0, output=output)
+        pipelineMonitor.overMemory = lambda: True
+        pool = RecordingPool(4)
+        parallelMap(pool, str, range(100), monitor=pipelineMonitor)
+        self.assertEqual(1, len(pool.submitted))
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(parallelMap(pool, str, range(100), sizeFunc=lambda x: 1, monitor=pipelineMonitor))
+        self.assertEqual([str(x) for x in range(100)], results)
+        self.assertEqual(100, pipelineMonitor.items)
+        self.assertGreater(pipelineMonitor.throttleCount, 0)
+        self.assertEqual(100, len(output.getvalue().splitlines()))
+
+class PriorityMapTest(unittest.TestCase):
+
+    def testMaxInFlightValidated(self):
+        with ThreadPoolExecutor(1) as pool:
+            with self.assertRaises(ValueError):
+                list(priorityMap(pool, str, range(3), maxInFlight=0))
+
+if __name__ == '__main__':
+    unittest.main()
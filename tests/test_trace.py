@@ -0,0 +1,92 @@
+# coding=utf-8
+
+import json
+import os
+import tempfile
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from geneeasdk import s2cli
+from geneeasdk.sentiment import getSentiment
+from geneeasdk.util import restutil, trace
+from geneeasdk.util.client import ResidentClient
+from geneeasdk.util.datautil import Document
+from geneeasdk.util.restutil import S2ApiInput, TransportResponse
+
+def sentimentTransport(url, headers, data, timeout):
+    return TransportResponse(200, json.dumps({'sentiment': 0.0, 'label': 'neutral', 'language': 'en'}))
+
+class TracerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpDir.name, 'trace.json')
+        self.tracer = trace.Tracer(self.path)
+        self.docs = [Document.make(str(i), 'text {}'.format(i)) for i in range(20)]
+
+    def tearDown(self):
+        self.tracer.close()
+        self.tmpDir.cleanup()
+
+    def _events(self):
+        self.tracer.close()
+        with open(self.path, encoding='utf-8') as traceFile:
+            return json.load(traceFile)
+
+    def testThreadPoolPath(self):
+        with trace.activate(self.tracer):
+            results = list(getSentiment(self.docs, {}, url='u', threadCount=4, transport=sentimentTransport))
+        self.assertEqual(len(self.docs), len(results))
+        self.assertEqual({}, self.tracer._traceIds)
+        tracedIds = {e['args']['traceId'] for e in self._events() if e['name'] == 'network'}
+        self.assertEqual({doc.uid for doc in self.docs}, tracedIds)
+
+    def testResidentClientPath(self):
+        with trace.activate(self.tracer), ResidentClient(threadCount=2) as client:
+            results = list(getSentiment(self.docs, {}, url='u', client=client, transport=sentimentTransport))
+        self.assertEqual(len(self.docs), len(results))
+        self.assertEqual({}, self.tracer._traceIds)
+        tracedIds = {e['args']['traceId'] for e in self._events() if e['name'] == 'network'}
+        self.assertEqual({doc.uid for doc in self.docs}, tracedIds)
+
+    def testResidentClientUsesCallerContext(self):
+        with trace.activate(self.tracer), ResidentClient() as client:
+            with self.tracer.context('request-1'):
+                future = client.submit({'text': 'x'}, url='u', transport=sentimentTransport)
+            future.result(timeout=3)
+        networkEvents = [e for e in self._events() if e['name'] == 'network']
+        self.assertEqual(['request-1'], [e['args']['traceId'] for e in networkEvents])
+
+    def testOutputSpansTaggedByDocument(self):
+        with trace.activate(self.tracer):
+            docs, traceIds = s2cli._withTraceIds(iter(self.docs))
+            results = getSentiment(docs, {}, url='u', threadCount=4, transport=sentimentTransport)
+            for _ in self.tracer.consumed(results, 'output', traceIds):
+                pass
+        outputEvents = [e for e in self._events() if e['name'] == 'output']
+        self.assertEqual([doc.uid for doc in self.docs], [e['args']['traceId'] for e in outputEvents])
+        self.assertEqual(list(range(len(self.docs))), [e['args']['index'] for e in outputEvents])
+
+    def testNoTraceIdsWhenDisabled(self):
+        docs, traceIds = s2cli._withTraceIds(self.docs)
+        self.assertIs(self.docs, docs)
+        self.assertIsNone(traceIds)
+
+    def testPriorityMapPath(self):
+        with trace.activate(self.tracer), ThreadPoolExecutor(2) as pool:
+            inputs = restutil.s2ApiInputStream(self.docs, {})
+            results = list(restutil.priorityMap(pool, S2ApiInput.serialize, inputs, maxInFlight=2))
+        self.assertEqual(len(self.docs), len(results))
+        self.assertEqual({}, self.tracer._traceIds)
+
+    def testBindingChecksIdentity(self):
+        bound, other = ['a'], ['a']
+        self.tracer.bind(bound, 'doc')
+        self.assertEqual('doc', self.tracer.traceIdOf(bound))
+        self.assertIsNone(self.tracer.traceIdOf(other))
+        self.tracer.unbind(bound)
+        self.assertIsNone(self.tracer.traceIdOf(bound))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+# coding=utf-8
+
+import os
+import re
+import tempfile
+import unittest
+
+from geneeasdk.util import vertical
+
+def verticalLines(docCount, docIdFormat='doc {}'):
+    for i in range(docCount):
+        yield docIdFormat.format(i) + '\n'
+        yield 'Hello\tNNP\n'
+        yield 'world\tNN\n'
+        yield '\n'
+
+class VerticalTest(unittest.TestCase):
+
+    def testLiteralPrefix(self):
+        self.assertEqual('doc ', vertical._literalPrefix(re.compile(r'doc \d+')))
+        self.assertEqual('doc', vertical._literalPrefix(re.compile(r'docs? \d+')))
+        self.assertEqual('', vertical._literalPrefix(re.compile(r'doc \d+', re.IGNORECASE)))
+        self.assertEqual('', vertical._literalPrefix(re.compile(r'doc \d+', re.VERBOSE)))
+
+    def testVerboseRegex(self):
+        # the space is not significant in a verbose pattern
+        docs = list(vertical.tabularDocStream(verticalLines(30, 'doc{}'), re.compile(r'doc \d+', re.VERBOSE)))
+        self.assertEqual(30, len(docs))
+
+    def testParallelMatchesSequential(self):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            path = os.path.join(tmpDir, 'docs.vert')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(verticalLines(300))
+            with open(path, encoding='utf-8') as f:
+                expected = list(vertical.tabularDocStream(f, r'doc \d+'))
+            actual = list(vertical.parallelTabularDocStream(path, r'doc \d+', processCount=2, chunkSize=1000))
+        self.assertEqual(expected, actual)
+
+if __name__ == '__main__':
+    unittest.main()